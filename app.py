@@ -1,37 +1,208 @@
-from flask import Flask, request, render_template, send_file, jsonify, Response
-import pandas as pd
+from flask import Flask, Request, request, render_template, send_file, jsonify, Response
+from werkzeug.exceptions import RequestEntityTooLarge
+import csv
 import json
 import os
 import re
+import hashlib
+import random
+import ast
+import unicodedata
+import sqlite3
+import uuid
 from io import BytesIO
-from openpyxl import Workbook
-import requests
 import logging
 import time
+import datetime
 import threading
-from queue import Queue, Empty
+import signal
+import socket
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+from collections import Counter, OrderedDict, deque
+import contextvars
+import heapq
+import itertools
+import cProfile
+import io
+import pstats
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
 
 app = Flask(__name__)
 app.secret_key = "your_secret_key"  # Flash 메시지용
 
 # --- 로깅 설정 ---
-log_queue = Queue()
+# 로그는 /logs 구독자별 고정 크기 버퍼로 전달 (구독자가 없으면 최근 로그만 보관)
+# threading 기본 객체만 사용하므로 gevent monkey patch 환경에서도 동작
+LOG_SUBSCRIBER_BUFFER = int(os.environ.get("LOG_SUBSCRIBER_BUFFER", 1000))  # 구독자별 최대 대기 로그 수
+LOG_HISTORY_SIZE = int(os.environ.get("LOG_HISTORY_SIZE", 200))  # 새 구독자에게 먼저 보낼 최근 로그 수
+LOG_KEEPALIVE_SECONDS = float(os.environ.get("LOG_KEEPALIVE_SECONDS", 15))
 
-class QueueHandler(logging.Handler):
-    def __init__(self, log_queue):
+current_job_id = contextvars.ContextVar("current_job_id", default=None)  # 로그를 작업별로 구분하기 위한 컨텍스트
+
+class LogSubscriber:
+    def __init__(self, job_id, buffer_size):
+        self.job_id = job_id  # None이면 모든 작업의 로그 수신
+        self.buffer = deque(maxlen=buffer_size)  # 가득 차면 오래된 로그부터 버림
+        self.dropped = 0
+        self.cond = threading.Condition()
+
+    def push(self, job_id, message, event=None):
+        if self.job_id is not None and job_id != self.job_id: return
+        with self.cond:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append((event, message))
+            self.cond.notify()
+
+    def pop_all(self, timeout):
+        # ([(이벤트 이름, 메시지)], 버려진 로그 수) 반환. timeout 동안 새 로그가 없으면 빈 목록
+        with self.cond:
+            if not self.buffer:
+                self.cond.wait(timeout)
+            messages, dropped = list(self.buffer), self.dropped
+            self.buffer.clear()
+            self.dropped = 0
+        return messages, dropped
+
+class LogBroadcaster:
+    def __init__(self, history_size):
+        self.subscribers = set()
+        self.history = deque(maxlen=history_size)  # (job_id, message, event)
+        self.lock = threading.Lock()
+        self.forward = None  # 워커 프로세스: 로그를 jobs.db로 넘겨 웹 프로세스의 /logs에서 보이도록 함
+
+    def publish(self, job_id, message, event=None):
+        # event: None이면 일반 로그, 그 외에는 SSE 이벤트 이름 (예: "progress")
+        if self.forward is not None:
+            self.forward(job_id, message, event)
+        with self.lock:
+            self.history.append((job_id, message, event))
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.push(job_id, message, event)
+
+    def subscribe(self, job_id=None):
+        subscriber = LogSubscriber(job_id, LOG_SUBSCRIBER_BUFFER)
+        with self.lock:
+            for entry in self.history:
+                subscriber.push(*entry)
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+log_broadcaster = LogBroadcaster(LOG_HISTORY_SIZE)
+
+class BroadcastHandler(logging.Handler):
+    def __init__(self, broadcaster):
         super().__init__()
-        self.log_queue = log_queue
+        self.broadcaster = broadcaster
 
     def emit(self, record):
-        self.log_queue.put(self.format(record))
+        self.broadcaster.publish(current_job_id.get(), self.format(record))
 
-handler = QueueHandler(log_queue)
+handler = BroadcastHandler(log_broadcaster)
 formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 handler.setFormatter(formatter)
 root_logger = logging.getLogger()
 root_logger.addHandler(handler)
 root_logger.setLevel(logging.INFO)
 
+# --- 메트릭 (Prometheus 텍스트 형식, /metrics) ---
+# 프로세스 단위로 집계됨 (gunicorn 워커가 여러 개면 워커별 값)
+# 큐 모드에서는 작업 워커 프로세스의 값이 jobs.db를 거쳐 웹 프로세스의 /metrics에 worker 라벨로 함께 표시됨
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800, 3600)
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.meta = {}  # 이름 -> (종류, 설명)
+        self.values = {}  # (이름, 라벨) -> 값. 히스토그램은 [버킷별 건수..., 합계, 건수]
+
+    def describe(self, name, kind, help_text):
+        self.meta[name] = (kind, help_text)
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.values.get(key)
+            if hist is None:
+                hist = self.values[key] = [0] * (len(HISTOGRAM_BUCKETS) + 2)
+            for index, bound in enumerate(HISTOGRAM_BUCKETS):
+                if value <= bound: hist[index] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def dump(self):
+        # 다른 프로세스로 넘길 수 있는 형태 [[이름, [[라벨, 값]...], 값]]
+        with self.lock:
+            return [[name, [list(label) for label in labels], value if not isinstance(value, list) else list(value)]
+                    for (name, labels), value in self.values.items()]
+
+    def render(self, remote=()):
+        # remote: [(워커 이름, dump() 결과)] -> worker 라벨을 붙여 함께 출력
+        with self.lock:
+            values = list(self.values.items())
+        for worker, entries in remote:
+            values += [((name, tuple(sorted([*map(tuple, labels), ("worker", worker)]))), value) for name, labels, value in entries]
+        values.sort(key=lambda item: item[0])
+        lines, described = [], set()
+        for (name, labels), value in values:
+            kind, help_text = self.meta.get(name, ("untyped", ""))
+            if name not in described:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                described.add(name)
+            label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+            if kind != "histogram":
+                lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+                continue
+            prefix = label_str + "," if label_str else ""
+            for bound, count in zip(HISTOGRAM_BUCKETS, value):
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {value[-1]}')
+            suffix = f"{{{label_str}}}" if label_str else ""
+            lines.append(f"{name}_sum{suffix} {value[-2]}")
+            lines.append(f"{name}_count{suffix} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.describe("pps_api_request_seconds", "histogram", "Perplexity API HTTP request latency (per attempt)")
+metrics.describe("pps_api_requests_total", "counter", "Perplexity API HTTP requests by status")
+metrics.describe("pps_api_retries_total", "counter", "Perplexity API retries")
+metrics.describe("pps_parse_reasks_total", "counter", "Follow-up requests for replies without parseable JSON")
+metrics.describe("pps_api_inflight", "gauge", "Perplexity API requests in flight")
+metrics.describe("pps_stage_seconds", "histogram", "Time spent per pipeline stage")
+metrics.describe("pps_cache_requests_total", "counter", "Price cache lookups by result")
+metrics.describe("pps_rows_processed_total", "counter", "Rows written by outcome")
+metrics.describe("pps_jobs_total", "counter", "Finished jobs by status")
+metrics.describe("pps_job_duration_seconds", "histogram", "Job duration by status")
+metrics.describe("pps_jobs_queued", "gauge", "Jobs waiting for a scheduler slot")
+metrics.describe("pps_jobs_running", "gauge", "Jobs currently running")
+metrics.describe("pps_api_key_requests_total", "counter", "Perplexity API requests by key and status")
+metrics.describe("pps_api_key_tokens_total", "counter", "Perplexity API tokens used by key")
+metrics.describe("pps_api_key_inflight", "gauge", "Perplexity API requests in flight by key")
+
 # --- 유틸리티 함수 ---
 def clean_json_response(response_str):
     response_str = response_str.strip()
@@ -42,23 +213,418 @@ def clean_json_response(response_str):
         response_str = "\n".join(lines).strip()
     return response_str
 
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PY_LITERALS = re.compile(r"(?<![\w\"'])(None|True|False)(?![\w\"'])")
+_SMART_QUOTES = str.maketrans({"\u201c": '"', "\u201d": '"', "\u2018": "'", "\u2019": "'"})
+
+def _balanced_spans(text, opener):
+    # 문자열 내부의 괄호는 무시하고, opener로 시작하는 균형 잡힌 구간을 앞에서부터 반환
+    closer = "}" if opener == "{" else "]"
+    start = text.find(opener)
+    while start != -1:
+        depth, in_string, escaped, quote = 0, False, False, None
+        for index in range(start, len(text)):
+            char = text[index]
+            if in_string:
+                if escaped: escaped = False
+                elif char == "\\": escaped = True
+                elif char == quote: in_string = False
+            elif char in "\"'":
+                in_string, quote = True, char
+            elif char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    if char == closer: yield text[start:index + 1]
+                    break
+        start = text.find(opener, start + 1)
+
+def _loads_lenient(candidate):
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+    repaired = _TRAILING_COMMA.sub(r"\1", candidate.translate(_SMART_QUOTES))
+    try:
+        return json.loads(_PY_LITERALS.sub(lambda m: {"None": "null", "True": "true", "False": "false"}[m.group(1)], repaired))
+    except json.JSONDecodeError:
+        pass
+    try:  # 작은따옴표 문자열, None 등 파이썬 dict 형태
+        return ast.literal_eval(re.sub(r"(?<![\w\"'])(null|true|false)(?![\w\"'])",
+                                       lambda m: {"null": "None", "true": "True", "false": "False"}[m.group(1)], repaired))
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+def extract_json(response_str, opener="{"):
+    # 응답에서 첫 번째로 파싱 가능한 JSON 객체(opener="{") 또는 배열(opener="[")을 찾아 반환. 없으면 None
+    # 코드 펜스, 앞뒤 설명문, trailing comma, 스마트 따옴표, 파이썬 리터럴(None/True) 허용
+    text = clean_json_response(response_str)
+    if text.startswith(opener):
+        try:
+            return json.loads(text)  # 대부분의 정상 응답은 여기서 끝남
+        except json.JSONDecodeError:
+            pass
+    expected = dict if opener == "{" else list
+    for candidate in _balanced_spans(text, opener):
+        value = _loads_lenient(candidate)
+        if isinstance(value, expected):
+            return value
+    return None
+
+_VAT_EXCLUDED = re.compile(r"(VAT|부가세|부가가치세)\s*(별도|미포함|제외)|\(\s*별도\s*\)|excl(\.|uding)?\s*VAT|VAT\s*excl", re.IGNORECASE)
+_PRICE_NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
 def process_price(price_str):
-    if price_str is None: return None
+    # "1,947,000원 (VAT 별도)" -> 2141700, "194.7만원" -> 1947000. 첫 번째 금액만 사용
+    if price_str is None or isinstance(price_str, bool): return None
     if isinstance(price_str, (int, float)): return price_str
-    price_str = re.sub(r"[^0-9,]", "", price_str)
+    text = unicodedata.normalize("NFKC", str(price_str))
+    match = _PRICE_NUMBER.search(text)
+    if not match: return None
     try:
-        price_int = int(price_str.replace(",", ""))
-        if "VAT 별도" in price_str.lower() or "(별도)" in price_str.lower():
-            price_int = int(price_int * 1.1)
-        return price_int
+        amount = float(match.group().replace(",", ""))
     except ValueError: return None
+    if text[match.end():].lstrip().startswith("만"):
+        amount *= 10000
+    if _VAT_EXCLUDED.search(text):
+        amount *= 1.1
+    return int(round(amount))
 
 # --- API 호출 함수 ---
 PERPLEXITY_API_KEY = os.environ.get("PERPLEXITY_API_KEY", "your_api_key_here")
-API_BASE_URL = "https://api.perplexity.ai"
+API_BASE_URL = os.environ.get("PERPLEXITY_API_BASE", "https://api.perplexity.ai")
+
+# --- 동시 실행 설정 ---
+SEARCH_CONCURRENCY = int(os.environ.get("SEARCH_CONCURRENCY", 4))  # 동시에 실행할 API 호출 수
+PERPLEXITY_RPM = float(os.environ.get("PERPLEXITY_RPM", 50))  # API 키별 분당 최대 요청 수 기본값 (0 이하면 제한 없음)
+JOB_RPM = float(os.environ.get("JOB_RPM", 0))  # 작업별 분당 최대 요청 수 기본값 (0 = 제한 없음, 키 한도는 키 풀에서 적용)
+
+class RateLimiter:
+    # 토큰 버킷 방식의 분당 요청 수 제한 (스레드 안전)
+    def __init__(self, rpm, burst=None):
+        self.rate = rpm / 60.0 if rpm and rpm > 0 else 0
+        self.capacity = burst if burst is not None else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        # 토큰이 있으면 하나 쓰고 0, 없으면 다음 토큰까지 기다려야 할 시간(초) 반환
+        if not self.rate: return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, sleep=time.sleep):
+        # sleep: 대기 함수 (작업별 제한은 취소되면 바로 깨어나는 api_scheduler.sleep 사용)
+        while True:
+            wait = self.reserve()
+            if not wait: return
+            sleep(wait)
+
+# --- API 키 풀 ---
+# PERPLEXITY_API_KEYS="이름=키:분당요청수:요청한도,..." (쉼표/줄바꿈 구분, 이름/분당요청수/요청한도는 생략 가능)
+#   예: "팀A=pplx-aaa:100:20000,팀B=pplx-bbb,pplx-ccc::5000"
+#   분당요청수 생략 시 PERPLEXITY_RPM, 요청한도(API_KEY_BUDGET_WINDOW 동안 최대 요청 수) 생략 시 무제한
+# 비어 있으면 PERPLEXITY_API_KEY 하나로 동작. 키마다 요청 수 제한이 따로 적용되므로 키를 늘리면 전체 처리량도 늘어남
+# 한도는 프로세스 단위로 적용됨 (워커 프로세스가 여러 개면 키별 분당요청수/요청한도를 프로세스 수로 나눠 설정)
+# 큐 모드의 /api_keys 는 워커 프로세스들의 사용량을 jobs.db에서 모아 합산해서 보여줌
+PERPLEXITY_API_KEYS = os.environ.get("PERPLEXITY_API_KEYS", "")
+API_KEY_BUDGET_WINDOW = float(os.environ.get("API_KEY_BUDGET_WINDOW", 24 * 3600))  # 키별 요청한도 집계 구간(초)
+KEY_REJECTED_STATUS = {401, 429}  # 키 단위 거부 -> 해당 키를 빼고 다른 키로 재시도
+
+class ApiKey:
+    def __init__(self, name, secret, rpm, budget=0):
+        self.name = name  # 메트릭/사용량 보고용 이름 (키 값은 노출하지 않음)
+        self.secret = secret
+        self.rpm = rpm
+        self.limiter = RateLimiter(rpm)
+        self.budget = budget  # API_KEY_BUDGET_WINDOW 동안 최대 요청 수 (0 = 무제한)
+        self.window_started = time.monotonic()
+        self.used = 0  # 현재 집계 구간 요청 수
+        self.requests = self.tokens = self.inflight = 0
+        self.statuses = Counter()
+        self.cooldown_until = 0.0  # 429 이후 이 시각까지 사용하지 않음
+        self.strikes = 0  # 연속 429 횟수 (Retry-After가 없을 때 백오프 계산용)
+        self.disabled = None  # 401 등으로 제외된 사유
+
+    def state(self, now):
+        if self.disabled: return "disabled"
+        if self.budget and self.used >= self.budget: return "exhausted"
+        if self.cooldown_until > now: return "cooldown"
+        return "active"
+
+class ApiKeyPool:
+    # 요청마다 사용할 키 선택: 지금 바로 보낼 수 있는 키 중 진행 중 요청이 가장 적은 키 (모두 대기 중이면 가장 빨리 풀리는 키까지 대기)
+    # 401 -> 키 제외, 429 -> Retry-After(없으면 지수 백오프) 동안 제외, 요청한도 소진 -> 집계 구간이 끝날 때까지 제외
+    def __init__(self, keys, budget_window=API_KEY_BUDGET_WINDOW):
+        self.keys = keys
+        self.budget_window = budget_window
+        self.lock = threading.Lock()
+
+    def acquire(self, sleep=time.sleep):
+        # sleep: 쿨다운/분당 한도 대기 함수 (작업 안에서는 취소되면 바로 JobCancelled를 내는 api_scheduler.sleep)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                waits = []
+                for key in sorted(self.keys, key=lambda k: k.inflight):
+                    if now - key.window_started >= self.budget_window:
+                        key.window_started, key.used = now, 0
+                    state = key.state(now)
+                    if state == "cooldown": waits.append(key.cooldown_until - now)
+                    if state != "active": continue
+                    wait = key.limiter.reserve()
+                    if wait:
+                        waits.append(wait)
+                        continue
+                    key.used += 1
+                    key.requests += 1
+                    key.inflight += 1
+                    metrics.inc("pps_api_key_inflight", key=key.name)
+                    return key
+                if not waits:
+                    states = Counter(key.state(now) for key in self.keys)
+                    raise ApiUnavailableError(f"사용 가능한 API 키가 없습니다 (비활성화 {states['disabled']}개, 요청한도 소진 {states['exhausted']}개).")
+            sleep(min(waits))
+
+    def release(self, key, status, retry_after=None):
+        # status: HTTP 상태 코드 또는 네트워크 오류 이름
+        with self.lock:
+            key.inflight -= 1
+            key.statuses[str(status)] += 1
+            if status == 401 and not key.disabled:
+                key.disabled = "401 인증 실패"
+                root_logger.error(f"API 키 '{key.name}' 인증 실패(401), 키 풀에서 제외합니다.")
+            elif status == 429:
+                key.strikes += 1
+                delay = retry_after if retry_after is not None else \
+                    random.uniform(0.5, 1.0) * min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** (key.strikes - 1))
+                key.cooldown_until = max(key.cooldown_until, time.monotonic() + delay)
+                root_logger.warning(f"API 키 '{key.name}' 요청 한도 초과(429), {delay:.1f}초간 다른 키를 사용합니다.")
+            elif isinstance(status, int) and status < 500:
+                key.strikes = 0
+        metrics.inc("pps_api_key_inflight", -1, key=key.name)
+        metrics.inc("pps_api_key_requests_total", key=key.name, status=str(status))
+
+    def record_usage(self, key, data):
+        tokens = int(((data or {}).get("usage") or {}).get("total_tokens") or 0)
+        if not tokens: return
+        with self.lock:
+            key.tokens += tokens
+        metrics.inc("pps_api_key_tokens_total", tokens, key=key.name)
+
+    def snapshot(self):
+        with self.lock:
+            now = time.monotonic()
+            return [{
+                "name": key.name, "state": key.state(now), "rpm": key.rpm, "budget": key.budget, "used": key.used,
+                "budget_resets_in": round(max(0.0, key.window_started + self.budget_window - now), 1),
+                "requests": key.requests, "tokens": key.tokens, "inflight": key.inflight,
+                "cooldown": round(max(0.0, key.cooldown_until - now), 1), "disabled": key.disabled,
+                "statuses": dict(key.statuses),
+            } for key in self.keys]
+
+def parse_api_keys(spec, default_rpm):
+    keys = []
+    for entry in re.split(r"[,\n]", spec):
+        entry = entry.strip()
+        if not entry: continue
+        name, sep, rest = entry.partition("=")
+        if not sep: name, rest = "", entry
+        secret, *limits = rest.split(":")
+        rpm = float(limits[0]) if limits and limits[0].strip() else default_rpm
+        budget = int(limits[1]) if len(limits) > 1 and limits[1].strip() else 0
+        keys.append(ApiKey(name.strip() or f"key{len(keys) + 1}", secret.strip(), rpm, budget))
+    return keys
+
+def merge_key_usage(snapshots):
+    # 여러 프로세스의 ApiKeyPool.snapshot()을 키 이름별로 합산 (상태는 프로세스마다 다를 수 있어 상태별 프로세스 수로 표시)
+    merged = OrderedDict()
+    for keys in snapshots:
+        for key in keys:
+            total = merged.setdefault(key["name"], {"name": key["name"], "rpm": key["rpm"], "budget": key["budget"], "used": 0,
+                                                    "requests": 0, "tokens": 0, "inflight": 0, "states": Counter(), "statuses": Counter()})
+            for field in ("used", "requests", "tokens", "inflight"):
+                total[field] += key[field]
+            total["states"][key["state"]] += 1
+            total["statuses"].update(key["statuses"])
+    return list(merged.values())
+
+api_keys = ApiKeyPool(parse_api_keys(PERPLEXITY_API_KEYS, PERPLEXITY_RPM) or [ApiKey("default", PERPLEXITY_API_KEY, PERPLEXITY_RPM)])
+
+# --- HTTP 클라이언트 (커넥션 풀 + 재시도 + 서킷 브레이커) ---
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 32))
+API_TIMEOUT = float(os.environ.get("API_TIMEOUT", 20))
+API_MAX_RETRIES = int(os.environ.get("API_MAX_RETRIES", 4))
+API_BACKOFF_BASE = float(os.environ.get("API_BACKOFF_BASE", 1.0))  # 지수 백오프 시작값(초)
+API_BACKOFF_MAX = float(os.environ.get("API_BACKOFF_MAX", 30.0))
+API_RETRY_AFTER_MAX = float(os.environ.get("API_RETRY_AFTER_MAX", 120.0))  # Retry-After 헤더 최대 허용값(초)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", 10))  # 연속 실패 횟수
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", 30))  # 차단 후 재시도(probe)까지 대기
+CIRCUIT_MAX_PAUSE = float(os.environ.get("CIRCUIT_MAX_PAUSE", 30 * 60))  # 이 시간 이상 복구 안 되면 작업 실패 처리
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    # keep-alive 커넥션 재사용. requests는 첫 API 호출 때 불러옴 (웹 프로세스 시작 시간/메모리 절약)
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            import requests
+            session = requests.Session()
+            session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE))
+            session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE))
+            _http_session = session
+    return _http_session
+
+class ApiUnavailableError(Exception):
+    # API 장애가 CIRCUIT_MAX_PAUSE 이상 지속됨 -> 작업을 중단 (체크포인트로 재개 가능)
+    pass
+
+class JobCancelled(Exception):
+    # 사용자가 작업을 취소함 -> 재시도/재요청 없이 작업 전체를 중단
+    pass
+
+class CircuitBreaker:
+    # 연속 실패가 임계값을 넘으면 모든 호출을 일시 중지하고, 대기 후 한 건만 시험 호출(half-open)
+    def __init__(self, failure_threshold, reset_seconds, max_pause):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.max_pause = max_pause
+        self.failures = 0
+        self.opened_at = None  # 마지막으로 차단된 시각
+        self.outage_started = None  # 최초 차단 시각 (성공 시 초기화)
+        self.probing = False
+        self.cond = threading.Condition()
+
+    def before_call(self, check=None):
+        # 차단 중이 아니면 False, 차단 후 시험 호출을 맡게 되면 True 반환
+        # check: 기다리는 동안 깨어날 때마다 호출 (작업이 취소되면 예외를 내서 대기 중단, 취소 시 wake()로 깨움)
+        with self.cond:
+            while self.opened_at is not None:
+                if check is not None: check()
+                now = time.monotonic()
+                if now - self.outage_started > self.max_pause:
+                    raise ApiUnavailableError(f"API 장애가 {int(now - self.outage_started)}초 이상 지속되어 작업을 중단합니다.")
+                remaining = self.opened_at + self.reset_seconds - now
+                if remaining <= 0 and not self.probing:
+                    self.probing = True
+                    return True
+                self.cond.wait(timeout=max(remaining, 1))
+            return False
+
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
+
+    def release_probe(self):
+        # 시험 호출이 성공/실패를 기록하지 못하고 끝남 (키 단위 거부, 예상하지 못한 예외) -> 다음 호출이 다시 시험
+        with self.cond:
+            if self.probing:
+                self.probing = False
+                self.cond.notify_all()
+
+    def record_success(self):
+        with self.cond:
+            if self.opened_at is not None:
+                root_logger.info("API 응답 복구, 검색을 재개합니다.")
+            self.failures = 0
+            self.opened_at = None
+            self.outage_started = None
+            self.probing = False
+            self.cond.notify_all()
+
+    def record_failure(self):
+        with self.cond:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                now = time.monotonic()
+                if self.opened_at is None:
+                    root_logger.warning(f"API 연속 {self.failures}회 실패, {self.reset_seconds:.0f}초간 검색을 일시 중지합니다.")
+                self.opened_at = now
+                self.outage_started = self.outage_started or now
+                self.probing = False
+                self.cond.notify_all()
+
+circuit_breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS, CIRCUIT_MAX_PAUSE)
+
+def _parse_retry_after(value):
+    # 초 단위 숫자 또는 HTTP-date
+    if not value: return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try: delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError): return None
+    return min(max(delay, 0), API_RETRY_AFTER_MAX)
+
+def post_chat_completion(payload):
+    import requests
+    http_session = get_http_session()
+    job_id = current_job_id.get()
+    sleep = lambda seconds: api_scheduler.sleep(job_id, seconds)  # 취소되면 바로 깨어나 JobCancelled
+    for attempt in range(API_MAX_RETRIES + 1):
+        api_scheduler.check(job_id)  # 취소된 작업은 재시도/재요청도 하지 않음
+        probe = circuit_breaker.before_call(lambda: api_scheduler.check(job_id))
+        key, status, retry_after, response = None, "error", None, None  # status: 예상하지 못한 예외로 끝나면 "error"
+        try:
+            key = api_keys.acquire(sleep)
+            api_scheduler.check(job_id)  # 서킷 브레이커/키를 기다리는 사이 취소됨 -> 요청을 보내지 않음 (finally에서 키/시험 호출 반납)
+            metrics.inc("pps_api_inflight")
+            with metrics.timer("pps_api_request_seconds"):
+                response = http_session.post(f"{API_BASE_URL}/chat/completions", json=payload, timeout=API_TIMEOUT,
+                                             headers={"Authorization": f"Bearer {key.secret}"})
+        except requests.exceptions.RequestException as e:  # 연결/타임아웃 외에 응답 도중 끊김(ChunkedEncodingError) 등 포함
+            status = type(e).__name__
+            metrics.inc("pps_api_requests_total", status=status)
+            circuit_breaker.record_failure()
+            error = e
+        else:
+            status = response.status_code
+            metrics.inc("pps_api_requests_total", status=str(status))
+            retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            if status in KEY_REJECTED_STATUS:
+                # 키 단위 거부는 서버 장애가 아님 -> 서킷 브레이커에 반영하지 않고 바로 다른 키로 재시도 (finally에서 키 쿨다운/제외)
+                error = requests.exceptions.HTTPError(f"{status} Error", response=response)
+                if attempt == API_MAX_RETRIES: break
+                metrics.inc("pps_api_retries_total")
+                continue
+            if status not in RETRYABLE_STATUS:
+                circuit_breaker.record_success()  # 4xx 포함, 서버는 정상 응답
+                response.raise_for_status()
+                data = response.json()
+                api_keys.record_usage(key, data)
+                return data
+            circuit_breaker.record_failure()
+            error = requests.exceptions.HTTPError(f"{status} Error", response=response)
+        finally:
+            if key is not None:  # 어떤 경로로 빠져나가도 키의 진행 중 요청 수를 반납
+                metrics.inc("pps_api_inflight", -1)
+                api_keys.release(key, status, retry_after)
+            if probe: circuit_breaker.release_probe()  # 기록 없이 빠져나간 시험 호출(키 없음 포함)이 probing을 계속 잡고 있지 않도록
+        if attempt == API_MAX_RETRIES: break
+        # Retry-After가 있으면 우선, 없으면 지수 백오프 + jitter
+        delay = retry_after if retry_after is not None else random.uniform(0.5, 1.0) * min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt)
+        root_logger.warning(f"API 호출 실패 ({error}), {delay:.1f}초 후 재시도 ({attempt + 1}/{API_MAX_RETRIES})")
+        metrics.inc("pps_api_retries_total")
+        sleep(delay)
+    raise error
+
+PARSE_REASK = os.environ.get("PARSE_REASK", "1") == "1"  # JSON을 찾지 못한 응답에 한해 1회 재요청
+REASK_PROMPT = "Your previous reply did not contain valid JSON. Reply again with ONLY the JSON object, no other text."
 
 def search_price_api(product_name, system_prompt, model="sonar"):
-    headers = {"Authorization": f"Bearer {PERPLEXITY_API_KEY}"}
+    import requests
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": f"Find the highest and lowest prices for '{product_name}' in Korean Won (KRW), including VAT."},
@@ -66,76 +632,1539 @@ def search_price_api(product_name, system_prompt, model="sonar"):
     payload = { "model": model, "messages": messages, "temperature": 0.7 }
 
     try:
-        response = requests.post(f"{API_BASE_URL}/chat/completions", json=payload, headers=headers, timeout=20) #timeout 늘림
-        response.raise_for_status()
-        data = response.json()
+        data = post_chat_completion(payload)
         content_str = data["choices"][0]["message"]["content"]
-        content_str = clean_json_response(content_str)  # Perplexity 응답 형식에 따라 주석처리/해제
 
-        try:
-            content_json = json.loads(content_str)
-            content_json["highest_price"] = process_price(content_json.get("highest_price"))
-            content_json["lowest_price"] = process_price(content_json.get("lowest_price"))
-            return content_json
-        except json.JSONDecodeError as e:
-            root_logger.error(f"JSONDecodeError: {e}, Response: {content_str}")
-            return _create_empty_result()
+        with metrics.timer("pps_stage_seconds", stage="parse"):
+            content_json = extract_json(content_str)
+        if content_json is None and PARSE_REASK:
+            # JSON을 전혀 찾지 못한 경우에만 같은 대화에 이어서 JSON만 다시 요청 (1회)
+            metrics.inc("pps_parse_reasks_total")
+            root_logger.warning(f"JSON 응답 아님, 재요청: {content_str[:200]}")
+            payload["messages"] = messages + [{"role": "assistant", "content": content_str},
+                                              {"role": "user", "content": REASK_PROMPT}]
+            content_str = post_chat_completion(payload)["choices"][0]["message"]["content"]
+            with metrics.timer("pps_stage_seconds", stage="parse"):
+                content_json = extract_json(content_str)
+        if content_json is None:
+            root_logger.error(f"JSON 파싱 실패, Response: {content_str}")
+            return _create_empty_result(error="JSON 파싱 실패")
+        content_json["highest_price"] = process_price(content_json.get("highest_price"))
+        content_json["lowest_price"] = process_price(content_json.get("lowest_price"))
+        return content_json
+    except (ApiUnavailableError, JobCancelled):  # 작업 전체를 중단 (행 하나의 오류 결과로 바꾸지 않음)
+        raise
     except requests.exceptions.RequestException as e:
         root_logger.error(f"API 호출 오류: {e}")
-        return _create_empty_result()
+        return _create_empty_result(error=str(e))
     except Exception as e:
         root_logger.error(f"기타 오류: {e}")
-        return _create_empty_result()
+        return _create_empty_result(error=str(e))
+
+def search_price_batch_api(product_names, system_prompt, model="sonar"):
+    # 여러 상품을 한 번의 요청으로 조회. {정규화된 상품명: 결과} 반환 (누락/형식 오류 항목은 제외 -> 호출측에서 단건 재조회)
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": (
+            "For each product in the JSON list below, find the highest and lowest prices in Korean Won (KRW), including VAT. "
+            "Return ONLY a JSON array with one object per product, in the same order. Each object MUST have a \"product\" field "
+            "containing the product name exactly as given, plus the fields of the JSON structure described above.\n"
+            f"Products: {json.dumps(list(product_names), ensure_ascii=False)}")},
+    ]
+    payload = { "model": model, "messages": messages, "temperature": 0.7 }
 
-def _create_empty_result():
-    return { "highest_price": None, "highest_price_product": None, "highest_price_source": None,
+    try:
+        data = post_chat_completion(payload)
+        with metrics.timer("pps_stage_seconds", stage="parse"):
+            content_str = data["choices"][0]["message"]["content"]
+            items = extract_json(content_str, "[")
+            if items is None: items = extract_json(content_str, "{")
+        if isinstance(items, dict):  # {"results": [...]} 또는 {상품명: {...}} 형태로 오는 경우
+            items = items.get("results") or [dict(value, product=key) for key, value in items.items() if isinstance(value, dict)]
+    except (ApiUnavailableError, JobCancelled):
+        raise
+    except Exception as e:
+        root_logger.error(f"배치 응답 처리 오류: {e}")
+        return {}
+
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or not item.get("product"): continue
+        try:
+            item["highest_price"] = process_price(item.get("highest_price"))
+            item["lowest_price"] = process_price(item.get("lowest_price"))
+        except Exception:
+            continue
+        results[normalize_product_name(item.pop("product"))] = item
+    return results
+
+ESCALATION_SPREAD_RATIO = float(os.environ.get("ESCALATION_SPREAD_RATIO", 5.0))  # 최고가/최저가 비율이 이보다 크면 신뢰도 낮음
+
+def needs_escalation(result):
+    # 2단계 모델 라우팅: 가격 누락, URL 누락, 비정상적인 최고/최저가 차이는 상위 모델로 재조회
+    high, low = result.get("highest_price"), result.get("lowest_price")
+    if not isinstance(high, (int, float)) or not isinstance(low, (int, float)): return True
+    if not result.get("highest_price_url") or not result.get("lowest_price_url"): return True
+    if low <= 0 or high < low or high / low > ESCALATION_SPREAD_RATIO: return True
+    return False
+
+def _is_empty_result(result):
+    return result.get("highest_price") is None and result.get("lowest_price") is None
+
+def _create_empty_result(error=None):
+    result = { "highest_price": None, "highest_price_product": None, "highest_price_source": None,
             "highest_price_url": None, "lowest_price": None, "lowest_price_product": None,
             "lowest_price_source": None, "lowest_price_url": None }
+    if error: result["error"] = error  # 진행 통계에서 '검색 결과 없음'과 '오류'를 구분
+    return result
+
+# --- 가격 조회 캐시 (SQLite) ---
+PRICE_CACHE_PATH = os.environ.get("PRICE_CACHE_PATH", "./cache/price_cache.db")
+PRICE_CACHE_TTL = float(os.environ.get("PRICE_CACHE_TTL", 7 * 24 * 3600))  # 초 단위, 0 이하면 캐시 사용 안 함
+PRICE_CACHE_MAX_ENTRIES = int(os.environ.get("PRICE_CACHE_MAX_ENTRIES", 100000))
+
+def clean_product_name(name, alias_rules=()):
+    # 앞뒤 공백 제거, NFKC 정규화, 연속 공백 축약 후 별칭 규칙 적용 (대소문자 유지 -> 실제 검색어)
+    text = " ".join(unicodedata.normalize("NFKC", str(name)).split())
+    for pattern, canonical in alias_rules:
+        text = pattern.sub(canonical, text)
+    return text
+
+def normalize_product_name(name, alias_rules=()):
+    return clean_product_name(name, alias_rules).casefold()
+
+def parse_alias_rules(text):
+    # 한 줄에 하나씩 "별칭 => 대표명" (대소문자 무시, 부분 일치 치환)
+    rules = []
+    for line in (text or "").splitlines():
+        if "=>" not in line: continue
+        alias, canonical = (part.strip() for part in line.split("=>", 1))
+        if alias:
+            rules.append((re.compile(re.escape(unicodedata.normalize("NFKC", alias)), re.IGNORECASE), canonical))
+    return rules
+
+class PriceCache:
+    # (정규화된 상품명, 모델, system prompt 해시) -> 검색 결과, TTL + LRU 방식 삭제
+    def __init__(self, path, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)  # 여러 워커 프로세스가 공유 (JobStore와 같은 대기 시간)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS price_cache ("
+                " key TEXT PRIMARY KEY, result TEXT NOT NULL,"
+                " created_at REAL NOT NULL, last_used REAL NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_price_cache_last_used ON price_cache(last_used)")
+            self.count = self.conn.execute("SELECT COUNT(*) FROM price_cache").fetchone()[0]  # 대략적인 행 수 (정리 시점 판단용)
+        self.trim_margin = max(1, max_entries // 10)  # 최대 개수를 이만큼 넘으면 한 번에 정리 (삽입마다 인덱스 전체를 훑지 않도록)
+
+    @staticmethod
+    def make_key(product_name, model, system_prompt):
+        prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+        return f"{normalize_product_name(product_name)}|{model}|{prompt_hash}"
+
+    # 캐시 DB 오류(database is locked 등)는 작업을 실패시키지 않고 미적중/기록 생략으로 처리
+    def get(self, key):
+        now = time.time()
+        try:
+            with self.lock, self.conn:
+                row = self.conn.execute("SELECT result, created_at FROM price_cache WHERE key = ?", (key,)).fetchone()
+                if row is None: return None
+                if now - row[1] > self.ttl:
+                    self.conn.execute("DELETE FROM price_cache WHERE key = ?", (key,))
+                    return None
+                self.conn.execute("UPDATE price_cache SET last_used = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            root_logger.warning(f"가격 캐시 조회 오류, 캐시 없이 진행합니다: {e}")
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, result):
+        try:
+            self._set(key, result)
+        except sqlite3.Error as e:
+            root_logger.warning(f"가격 캐시 기록 오류, 기록을 건너뜁니다: {e}")
+
+    def _set(self, key, result):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO price_cache (key, result, created_at, last_used) VALUES (?, ?, ?, ?)",
+                              (key, json.dumps(result, ensure_ascii=False), now, now))
+            self.count += 1  # 덮어쓰기/다른 프로세스의 삽입은 반영되지 않음 -> 정리할 때 실제 행 수로 다시 맞춤
+            if self.count > self.max_entries + self.trim_margin:
+                self.conn.execute(
+                    "DELETE FROM price_cache WHERE key IN (SELECT key FROM price_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,))
+                self.count = self.conn.execute("SELECT COUNT(*) FROM price_cache").fetchone()[0]
+
+    def recent(self, model, system_prompt, limit):
+        # 같은 모델/system prompt로 최근 조회한 (정규화 상품명, 결과) 목록 -> 유사 상품명 인덱스 초기화용
+        suffix = PriceCache.make_key("", model, system_prompt)
+        try:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT key, result FROM price_cache WHERE substr(key, -?) = ? AND created_at >= ? ORDER BY last_used DESC LIMIT ?",
+                    (len(suffix), suffix, time.time() - self.ttl, limit)).fetchall()
+        except sqlite3.Error as e:
+            root_logger.warning(f"가격 캐시 조회 오류, 유사 상품명 인덱스를 비운 채 시작합니다: {e}")
+            return []
+        return [(key[:-len(suffix)], json.loads(result)) for key, result in rows]
+
+price_cache = PriceCache(PRICE_CACHE_PATH, PRICE_CACHE_TTL, PRICE_CACHE_MAX_ENTRIES) if PRICE_CACHE_TTL > 0 else None
+
+# --- 유사 상품명 매칭 ---
+# 띄어쓰기/부가 문구만 다른 상품명("갤럭시 S24 256GB" vs "갤럭시 S24 256GB 자급제")은 이미 조회한 결과를 재사용
+# 표기 체계가 다른 이름(삼성 갤럭시 vs Samsung Galaxy)은 상품명 별칭 규칙으로 먼저 맞춘 뒤 비교
+# numpy는 유사도 매칭을 켠 작업에서만 불러옴 (웹 프로세스 시작 경로에서 제외)
+SIMILARITY_THRESHOLD = float(os.environ.get("SIMILARITY_THRESHOLD", 0))  # 코사인 유사도 기준 (0 = 사용 안 함)
+SIMILARITY_MAX_ENTRIES = int(os.environ.get("SIMILARITY_MAX_ENTRIES", 5000))  # 인덱스에 보관할 최대 상품명 수
+SIMILARITY_NGRAM = 3
+
+class SimilarityIndex:
+    # 문자 n-gram TF-IDF 벡터의 코사인 유사도로 가장 비슷한 상품명을 찾음
+    # 희소 벡터를 CSR처럼 1차원 배열에 이어 붙이고 np.bincount로 전체 점수를 한 번에 계산 (조회당 O(n-gram 수))
+    # 숫자(용량, 모델 번호 등)가 다르면 유사도와 관계없이 다른 상품으로 봄 (S24 256GB vs S24 512GB)
+    def __init__(self, threshold, max_entries=SIMILARITY_MAX_ENTRIES, n=SIMILARITY_NGRAM):
+        import numpy as np
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.n = n
+        self.vocab = {}  # n-gram -> 열 번호
+        self.entries = []  # (이름, 숫자 집합, 값)
+        self.indices = np.zeros(1024, dtype=np.int64)  # n-gram 번호 (항목 순서대로 이어 붙임)
+        self.rows = np.zeros(1024, dtype=np.int64)  # 각 n-gram이 속한 항목 번호
+        self.tf = np.zeros(1024, dtype=np.float32)
+        self.size = 0
+        self.df = np.zeros(1024, dtype=np.float32)
+        self.lock = threading.Lock()
+
+    def _vector(self, name, grow):
+        import numpy as np
+        text = f" {' '.join(name.split())} "
+        grams = Counter(text[i:i + self.n] for i in range(max(len(text) - self.n + 1, 1)))
+        ids, tf, unknown = [], [], []
+        for gram, count in grams.items():
+            index = self.vocab.get(gram)
+            if index is None and grow:
+                index = self.vocab[gram] = len(self.vocab)
+            weight = 1.0 + np.log(count)  # sublinear tf
+            if index is None: unknown.append(weight)
+            else:
+                ids.append(index)
+                tf.append(weight)
+        return np.array(ids, dtype=np.int64), np.array(tf, dtype=np.float32), np.array(unknown, dtype=np.float32)
+
+    @staticmethod
+    def _grow(array, size):
+        import numpy as np
+        if size <= len(array): return array
+        grown = np.zeros(max(size, len(array) * 2), dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def add(self, name, value):
+        with self.lock:
+            ids, tf, _ = self._vector(name, grow=True)
+            end = self.size + len(ids)
+            self.indices, self.rows, self.tf = (self._grow(a, end) for a in (self.indices, self.rows, self.tf))
+            self.indices[self.size:end] = ids
+            self.rows[self.size:end] = len(self.entries)
+            self.tf[self.size:end] = tf
+            self.size = end
+            self.df = self._grow(self.df, len(self.vocab))
+            self.df[ids] += 1
+            self.entries.append((name, frozenset(re.findall(r"\d+", name)), value))
+            if len(self.entries) > self.max_entries:
+                self._evict(len(self.entries) - self.max_entries // 2)  # 절반씩 한꺼번에 정리 (추가 비용 분산)
+
+    def _evict(self, count):
+        import numpy as np
+        # 오래된 항목 count개 제거 후 배열/문서 빈도 재구성
+        keep = self.rows[:self.size] >= count
+        self.indices, self.tf = self.indices[:self.size][keep].copy(), self.tf[:self.size][keep].copy()
+        self.rows = self.rows[:self.size][keep] - count
+        self.size = len(self.indices)
+        self.entries = self.entries[count:]
+        self.df = np.bincount(self.indices, minlength=len(self.df)).astype(np.float32)
+
+    def match(self, name):
+        import numpy as np
+        # (이름, 유사도, 값) 또는 None
+        with self.lock:
+            if not self.entries: return None
+            count = len(self.entries)
+            idf = np.log((1 + count) / (1 + self.df[:len(self.vocab)])) + 1
+            ids, tf, unknown = self._vector(name, grow=False)
+            query = np.zeros(len(idf), dtype=np.float32)
+            query[ids] = tf * idf[ids]
+            unseen = np.log(1 + count) + 1  # 처음 보는 n-gram의 idf (df = 0)
+            query_norm = np.sqrt(np.sum(query ** 2) + np.sum((unknown * unseen) ** 2))
+            if not query_norm: return None
+            indices, rows = self.indices[:self.size], self.rows[:self.size]
+            weights = self.tf[:self.size] * idf[indices]
+            norms = np.sqrt(np.bincount(rows, weights ** 2, minlength=count))
+            scores = np.bincount(rows, weights * query[indices], minlength=count) / (norms * query_norm)
+            numbers = frozenset(re.findall(r"\d+", name))
+            for row in np.flatnonzero(scores >= self.threshold)[np.argsort(-scores[scores >= self.threshold])]:
+                entry = self.entries[row]
+                if entry[1] == numbers:
+                    return entry[0], float(scores[row]), entry[2]
+        return None
+
+# --- 작업(Job) 저장소 / 스케줄러 ---
+# 작업 상태는 SQLite, 결과 파일은 디스크에 저장 -> 모든 gunicorn 워커에서 조회 가능
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", "./data/jobs.db")
+RESULTS_DIR = os.environ.get("RESULTS_DIR", "./data/results")
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", 4))  # 프로세스당 동시 실행 작업 수
+MAX_CONCURRENT_API_CALLS = int(os.environ.get("MAX_CONCURRENT_API_CALLS", 16))  # 전체 작업 합산 API 동시 호출 수
+JOB_PRIORITY_DEFAULT = 1
+JOB_PRIORITY_MAX = 10  # 우선순위 1~10: 높을수록 먼저 시작하고, API 동시 호출 슬롯도 우선순위에 비례해 더 많이 받음
+JOB_PRIORITY_PREEMPT = os.environ.get("JOB_PRIORITY_PREEMPT", "1") == "1"  # 작업 자리가 모두 차 있어도 실행 중인 모든 작업보다 우선순위가 높은 작업은 바로 시작
+JOB_BACKEND = os.environ.get("JOB_BACKEND", "inline")  # inline: 웹 프로세스에서 실행, queue: 별도 워커 프로세스(worker.py)에서 실행
+
+class JobStore:
+    FIELDS = ("id", "status", "total", "completed", "output_filename", "result_path", "error", "params", "stats", "worker",
+              "checkpoint", "checkpoint_key", "sheets", "created_at", "updated_at")
+    MIGRATIONS = ("ALTER TABLE jobs ADD COLUMN params TEXT", "ALTER TABLE jobs ADD COLUMN stats TEXT", "ALTER TABLE jobs ADD COLUMN worker TEXT",
+                  "ALTER TABLE jobs ADD COLUMN checkpoint TEXT", "ALTER TABLE jobs ADD COLUMN sheets TEXT",
+                  "ALTER TABLE jobs ADD COLUMN checkpoint_key TEXT")
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, total INTEGER, completed INTEGER NOT NULL DEFAULT 0,"
+                " output_filename TEXT, result_path TEXT, error TEXT,"
+                " created_at REAL NOT NULL, updated_at REAL NOT NULL)")
+            for migration in self.MIGRATIONS:  # 기존 DB에 새 컬럼 추가
+                try: self.conn.execute(migration)
+                except sqlite3.OperationalError: pass
+            self.conn.execute(  # 워커 프로세스 -> 웹 프로세스 로그 전달용
+                "CREATE TABLE IF NOT EXISTS job_logs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT, event TEXT, message TEXT NOT NULL, created_at REAL NOT NULL)")
+            self.conn.execute(  # 워커 프로세스 -> 웹 프로세스 /metrics, /api_keys 전달용 (워커별 최신 값 한 행)
+                "CREATE TABLE IF NOT EXISTS worker_stats ("
+                " worker TEXT PRIMARY KEY, metrics TEXT NOT NULL, api_keys TEXT NOT NULL, updated_at REAL NOT NULL)")
+
+    def create(self, output_filename, params=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT INTO jobs (id, status, output_filename, params, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                              (job_id, output_filename, json.dumps(params or {}, ensure_ascii=False), now, now))
+        return job_id
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock, self.conn:
+            self.conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute(f"SELECT {', '.join(self.FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def list(self, limit=50):
+        with self.lock:
+            rows = self.conn.execute(f"SELECT {', '.join(self.FIELDS)} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def claim(self, worker, stale_seconds, min_priority=0):
+        # 대기 중인 작업(또는 하트비트가 끊긴 실행 중 작업) 하나를 원자적으로 가져감 -> 여러 워커 프로세스가 안전하게 공유
+        # min_priority: 이 우선순위 이상인 작업만 (작업 자리가 찼을 때 더 급한 작업만 가져감)
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, updated_at = ? WHERE id = ("
+                " SELECT id FROM jobs WHERE (status = 'queued' OR (status = 'running' AND updated_at < ?))"
+                " AND COALESCE(json_extract(params, '$.priority'), ?) >= ?"
+                " ORDER BY COALESCE(json_extract(params, '$.priority'), ?) DESC, created_at LIMIT 1) RETURNING id",
+                (worker, now, now - stale_seconds, JOB_PRIORITY_DEFAULT, min_priority, JOB_PRIORITY_DEFAULT)).fetchone()
+        return row[0] if row else None
+
+    def start(self, job_id):
+        # 대기 중인 작업만 실행 상태로 바꿈 (대기 중에 일시정지/취소됐거나 이미 다른 곳에서 실행 중이면 False)
+        with self.lock, self.conn:
+            row = self.conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued' RETURNING id",
+                                    (time.time(), job_id)).fetchone()
+        return row is not None
+
+    def finish(self, job_id, result_path):
+        # 완료 처리. 그 사이 취소된 작업은 덮어쓰지 않고 False
+        with self.lock, self.conn:
+            row = self.conn.execute("UPDATE jobs SET status = 'done', result_path = ?, updated_at = ? WHERE id = ? AND status != 'cancelled' RETURNING id",
+                                    (result_path, time.time(), job_id)).fetchone()
+        return row is not None
+
+    def statuses(self, job_ids):
+        if not job_ids: return {}
+        with self.lock:
+            rows = self.conn.execute(f"SELECT id, status FROM jobs WHERE id IN ({', '.join('?' * len(job_ids))})", job_ids).fetchall()
+        return dict(rows)
+
+    def heartbeat(self, job_ids):
+        if not job_ids: return
+        with self.lock, self.conn:
+            self.conn.execute(f"UPDATE jobs SET updated_at = ? WHERE status IN ('running', 'paused') AND id IN ({', '.join('?' * len(job_ids))})",
+                              (time.time(), *job_ids))
+
+    def append_logs(self, entries):
+        # entries: [(job_id, message, event)]
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO job_logs (job_id, message, event, created_at) VALUES (?, ?, ?, ?)",
+                                  [(*entry, now) for entry in entries])
+
+    def logs_since(self, last_id, limit=1000):
+        # [(id, job_id, message, event)]. last_id가 None이면 최근 limit건
+        with self.lock:
+            if last_id is None:
+                rows = self.conn.execute("SELECT id, job_id, message, event FROM job_logs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+                return rows[::-1]
+            return self.conn.execute("SELECT id, job_id, message, event FROM job_logs WHERE id > ? ORDER BY id LIMIT ?",
+                                     (last_id, limit)).fetchall()
+
+    def prune_logs(self, before):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM job_logs WHERE created_at < ?", (before,))
+
+    def count(self, status):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def save_worker_stats(self, worker, metric_values, key_usage):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO worker_stats (worker, metrics, api_keys, updated_at) VALUES (?, ?, ?, ?)",
+                              (worker, json.dumps(metric_values, ensure_ascii=False), json.dumps(key_usage, ensure_ascii=False), time.time()))
+
+    def worker_stats(self, since):
+        # [(워커 이름, 메트릭, 키 사용량, 갱신 시각)]. since 이후 갱신된(살아 있는) 워커만
+        with self.lock:
+            rows = self.conn.execute("SELECT worker, metrics, api_keys, updated_at FROM worker_stats WHERE updated_at >= ? ORDER BY worker",
+                                     (since,)).fetchall()
+        return [(worker, json.loads(values), json.loads(keys), updated_at) for worker, values, keys, updated_at in rows]
+
+    def prune_worker_stats(self, before):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM worker_stats WHERE updated_at < ?", (before,))
+
+    def journals(self, checkpoint_key, exclude_job_id):
+        # 같은 입력/설정(checkpoint_key)으로 실행됐지만 완료되지 않은 다른 작업의 체크포인트 경로 (강제 종료된 작업 포함)
+        with self.lock:
+            rows = self.conn.execute("SELECT checkpoint FROM jobs WHERE checkpoint_key = ? AND id != ? AND status != 'done'"
+                                     " AND checkpoint IS NOT NULL ORDER BY updated_at DESC", (checkpoint_key, exclude_job_id)).fetchall()
+        return [row[0] for row in rows]
+
+    def file_in_use(self, path, exclude_job_id=None):
+        # 같은 업로드(내용 해시로 공유)를 입력/기준 파일로 쓰는 미완료 작업이 있는지 (실패/취소 작업은 재개 대비)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM jobs WHERE status IN ('queued', 'running', 'paused', 'failed', 'cancelled') AND id != ?"
+                " AND (json_extract(params, '$.file_path') = ? OR json_extract(params, '$.baseline_path') = ?) LIMIT 1",
+                (exclude_job_id or "", path, path)).fetchone()
+        return row is not None
+
+    def _to_job(self, row):
+        job = dict(zip(self.FIELDS, row))
+        job["params"] = json.loads(job["params"] or "{}")
+        job["stats"] = json.loads(job["stats"] or "{}")
+        job["sheets"] = json.loads(job["sheets"] or "[]")  # [[시트 이름, 출력 헤더]]
+        return job
+
+class ApiScheduler:
+    # 실행 중인 작업들이 MAX_CONCURRENT_API_CALLS개의 API 호출 슬롯을 우선순위(가중치)에 비례해 나눠 씀
+    # 빈 슬롯은 기다리는 작업 중 (사용 중 슬롯 수 / 가중치)가 가장 작은 작업에 배정, 같으면 (누적 호출 수 / 가중치)가 작은 작업
+    # 한 작업 안에서는 먼저 기다린 호출부터 (세마포어처럼 방금 반납한 스레드가 다시 가져가면 앞 행이 밀려 순서대로 기록하는 결과가 멈춤)
+    # 일시정지된 작업은 슬롯을 받지 않고(진행 중인 호출만 마무리), 취소된 작업은 기다리던 호출까지 JobCancelled로 즉시 중단
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.in_use = 0
+        self.jobs = {}  # job_id -> {"weight", "state", "active", "waiting"(대기 순번 deque), "served"}
+        self.cond = threading.Condition()
+
+    def register(self, job_id, weight, state="running"):
+        with self.cond:
+            self.jobs[job_id] = {"weight": max(weight, 1), "state": state if state in ("paused", "cancelled") else "running",
+                                 "active": 0, "waiting": deque(), "served": 0}
+            return self.jobs[job_id]
+
+    def unregister(self, job_id, job=None):
+        # job: register 이후 다른 실행이 같은 작업을 다시 등록했으면 해제하지 않음 (취소 후 남은 조회 스레드 정리 중 재개된 경우)
+        with self.cond:
+            if job is None or self.jobs.get(job_id) is job:
+                self.jobs.pop(job_id, None)
+            self.cond.notify_all()
+
+    def set_state(self, job_id, state):
+        # state: running | paused | cancelled. 이 프로세스에서 실행 중인 작업이 아니면 False
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None or state not in ("running", "paused", "cancelled"): return False
+            job["state"] = state
+            self.cond.notify_all()
+        if state == "cancelled": circuit_breaker.wake()  # 서킷 브레이커가 열려 기다리던 호출도 바로 중단
+        return True
+
+    def state(self, job_id):
+        job = self.jobs.get(job_id)
+        return job["state"] if job else None
+
+    def check(self, job_id):
+        if self.state(job_id) == "cancelled":
+            raise JobCancelled("사용자가 작업을 취소했습니다.")
+
+    def sleep(self, job_id, seconds):
+        # time.sleep 대신 사용 (재시도/키 쿨다운/분당 한도 대기). 작업이 취소되면 바로 깨어나 JobCancelled
+        deadline = time.monotonic() + seconds
+        with self.cond:
+            while self.state(job_id) != "cancelled" and (remaining := deadline - time.monotonic()) > 0:
+                self.cond.wait(remaining)
+        self.check(job_id)
+
+    def result(self, job_id, future):
+        # future.result() 대신 사용. 작업이 취소되면 응답을 기다리지 않고 바로 JobCancelled
+        if not future.done():
+            future.add_done_callback(self._wake)
+            with self.cond:
+                while not future.done() and self.state(job_id) != "cancelled":
+                    self.cond.wait()
+            if not future.done(): self.check(job_id)
+        return future.result()
+
+    def _wake(self, _):
+        with self.cond:
+            self.cond.notify_all()
+
+    def _next(self):
+        waiting = [(job["active"] / job["weight"], job["served"] / job["weight"], job_id)
+                   for job_id, job in self.jobs.items() if job["waiting"] and job["state"] == "running"]
+        return min(waiting)[2] if waiting else None
+
+    @contextmanager
+    def slot(self, job_id):
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None:  # 작업 밖에서의 호출 (가중치 1)
+                self.register(job_id, JOB_PRIORITY_DEFAULT)
+                job = self.jobs[job_id]
+            ticket = object()
+            job["waiting"].append(ticket)
+            try:
+                while job["state"] != "cancelled" and not (
+                        self.in_use < self.capacity and job["waiting"][0] is ticket and self._next() == job_id):
+                    self.cond.wait()
+            finally:
+                job["waiting"].remove(ticket)
+            if job["state"] == "cancelled":
+                self.cond.notify_all()
+                raise JobCancelled("사용자가 작업을 취소했습니다.")
+            job["active"] += 1
+            job["served"] += 1
+            self.in_use += 1
+            if self.in_use < self.capacity: self.cond.notify_all()  # 다음 순번이 남은 슬롯을 받도록
+        try:
+            yield
+        finally:
+            with self.cond:
+                job["active"] -= 1
+                self.in_use -= 1
+                self.cond.notify_all()
+
+class JobQueue:
+    # 대기 작업을 우선순위 높은 순 -> 제출 순으로 꺼냄
+    def __init__(self):
+        self.heap = []
+        self.order = itertools.count()
+        self.lock = threading.Lock()
+
+    def push(self, job_id, priority):
+        with self.lock:
+            heapq.heappush(self.heap, (-priority, next(self.order), job_id))
+
+    def pop(self):
+        with self.lock:
+            return heapq.heappop(self.heap)[2] if self.heap else None
+
+job_store = JobStore(JOBS_DB_PATH)
+job_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS)
+# 작업 자리가 모두 찼을 때 더 급한 작업을 바로 시작하는 여분 자리. 실행 중인 모든 작업보다 우선순위가 높아야 하므로
+# 여분 자리의 작업끼리는 우선순위가 모두 달라 우선순위 단계 수를 넘지 않음 (API 부하는 ApiScheduler가 우선순위에 비례해 나눔)
+priority_executor = ThreadPoolExecutor(max_workers=JOB_PRIORITY_MAX)
+pending_jobs = JobQueue()
+running_jobs = {}  # job_id -> 우선순위 (inline 모드에서 이 프로세스가 실행 중인 작업)
+running_jobs_lock = threading.Lock()
+api_scheduler = ApiScheduler(MAX_CONCURRENT_API_CALLS)
+
+def submit_job(job_id):
+    params = job_store.get(job_id)["params"]
+    job_store.update(job_id, status="queued", error=None, worker=None)
+    if JOB_BACKEND == "queue": return  # 워커 프로세스(worker.py)가 jobs.db에서 우선순위 순으로 가져가 실행
+    metrics.inc("pps_jobs_queued")
+    priority = params.get("priority", JOB_PRIORITY_DEFAULT)
+    pending_jobs.push(job_id, priority)
+    with running_jobs_lock:
+        threshold = start_priority(list(running_jobs.values()))
+    (priority_executor if threshold and priority >= threshold else job_executor).submit(run_next_job)
+
+def start_priority(running):
+    # running: 실행 중인 작업들의 우선순위. 지금 새로 시작할 수 있는 작업의 최소 우선순위 (0 = 제한 없음, None = 시작 불가)
+    if len(running) < MAX_CONCURRENT_JOBS: return 0
+    if JOB_PRIORITY_PREEMPT and max(running) < JOB_PRIORITY_MAX: return max(running) + 1
+    return None
+
+def run_next_job():
+    # job_executor 자리가 날 때마다 그 시점의 대기 작업 중 우선순위가 가장 높은 작업을 실행
+    job_id = pending_jobs.pop()
+    if job_id is None or not job_store.start(job_id):  # 대기 중에 일시정지/취소됨 (재개하면 다시 제출됨)
+        metrics.inc("pps_jobs_queued", -1)
+        return
+    params = job_store.get(job_id)["params"]
+    with running_jobs_lock:
+        running_jobs[job_id] = params.get("priority", JOB_PRIORITY_DEFAULT)
+    try:
+        background_search(job_id, **params)
+    finally:
+        with running_jobs_lock:
+            running_jobs.pop(job_id, None)
+
+# --- 진행 상황 (구조화된 progress 이벤트) ---
+PROGRESS_EVENT_INTERVAL = float(os.environ.get("PROGRESS_EVENT_INTERVAL", 1.0))  # progress 이벤트 최소 간격(초)
+THROUGHPUT_WINDOW = 60.0  # 처리 속도 계산 구간(초)
+
+class JobProgress:
+    # 완료/성공/빈 결과/오류 건수, 최근 처리 속도, API 지연 p50/p95, 남은 시간 추정
+    def __init__(self, job_id, total):
+        self.job_id = job_id
+        self.total = total
+        self.completed = self.success = self.empty = self.errors = self.restored = self.carried = self.matched = 0
+        self.started = time.monotonic()
+        self.latencies = deque(maxlen=1000)  # 최근 API 호출 소요 시간
+        self.finished_at = deque()  # 최근 THROUGHPUT_WINDOW 동안 완료된 행 시각
+        self.tiers = OrderedDict()  # 모델 -> {"calls", "seconds", "latencies"} (2단계 모델 라우팅)
+        self.escalated = self.escalation_improved = 0
+        self.last_emit = 0.0
+        self.lock = threading.Lock()
+
+    def record_latency(self, seconds, model=None):
+        with self.lock:
+            self.latencies.append(seconds)
+            if model is not None:
+                tier = self.tiers.setdefault(model, {"calls": 0, "seconds": 0.0, "latencies": deque(maxlen=1000)})
+                tier["calls"] += 1
+                tier["seconds"] += seconds
+                tier["latencies"].append(seconds)
+
+    def record_escalation(self, improved):
+        with self.lock:
+            self.escalated += 1
+            if improved: self.escalation_improved += 1
+
+    def record_row(self, result, restored=False, carried=False, matched=False):
+        now = time.monotonic()
+        with self.lock:
+            self.completed += 1
+            if restored: self.restored += 1
+            else: self.finished_at.append(now)
+            if carried: self.carried += 1
+            if matched: self.matched += 1
+            if result.get("error"): self.errors += 1
+            elif _is_empty_result(result): self.empty += 1
+            else: self.success += 1
+        outcome = "restored" if restored else "carried" if carried else "error" if result.get("error") else "empty" if _is_empty_result(result) else "success"
+        metrics.inc("pps_rows_processed_total", outcome=outcome)
+        if now - self.last_emit >= PROGRESS_EVENT_INTERVAL:
+            self.emit()
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            while self.finished_at and now - self.finished_at[0] > THROUGHPUT_WINDOW:
+                self.finished_at.popleft()
+            latencies = sorted(self.latencies)
+            window = min(THROUGHPUT_WINDOW, now - self.started) or 1e-9
+            throughput = len(self.finished_at) / window
+            remaining = max(self.total - self.completed, 0)
+            return {
+                "job_id": self.job_id, "completed": self.completed, "total": self.total,
+                "success": self.success, "empty": self.empty, "errors": self.errors, "restored": self.restored,
+                "carried": self.carried, "matched": self.matched,
+                "rows_per_sec": round(throughput, 2),
+                "latency_p50": round(latencies[int(0.50 * (len(latencies) - 1))], 3) if latencies else None,
+                "latency_p95": round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else None,
+                "elapsed": round(now - self.started, 1),
+                "eta_seconds": round(remaining / throughput, 1) if throughput else None,
+                "escalated": self.escalated, "escalation_improved": self.escalation_improved,
+                "tiers": {model: {"calls": tier["calls"], "latency_avg": round(tier["seconds"] / tier["calls"], 3),
+                                  "latency_p95": round(sorted(tier["latencies"])[int(0.95 * (len(tier["latencies"]) - 1))], 3)}
+                          for model, tier in self.tiers.items()},
+            }
+
+    def emit(self):
+        # 일정 간격으로만 호출 -> 대형 작업에서도 DB 쓰기/브라우저 이벤트 수 제한
+        self.last_emit = time.monotonic()
+        stats = self.snapshot()
+        job_store.update(self.job_id, completed=stats["completed"], stats=json.dumps(stats))
+        log_broadcaster.publish(self.job_id, json.dumps(stats), event="progress")
+
+# --- 체크포인트 (작업 재개용) ---
+# 작업마다 완료된 행을 <job_id>.jsonl에 행 순서대로 즉시 기록 (진행 중 결과 내보내기도 이 파일을 읽음)
+# 실패/취소되면 (입력 파일 내용, 모델, system prompt) 해시 이름의 공유 체크포인트로도 남겨서
+# 작업을 재개하거나 같은 파일을 새 작업으로 다시 제출하면 이미 처리된 행은 건너뜀
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "./data/checkpoints")
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", 300))  # 진행 기록이 없으면 중단된 작업으로 간주
+
+class Checkpoint:
+    def __init__(self, job_id, file_path, *options):
+        # options: 결과에 영향을 주는 작업 설정 (모델, system prompt 등)
+        digest = hashlib.sha256(file_digest(file_path).encode())
+        for option in options:
+            digest.update(b"\0" + str(option).encode("utf-8"))
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        self.path = os.path.join(CHECKPOINT_DIR, f"{job_id}.jsonl")  # 이번 실행 기록 (같은 파일을 쓰는 다른 작업과 섞이지 않음)
+        self.previous = os.path.join(CHECKPOINT_DIR, f"{job_id}.prev.jsonl")  # 이전 실행에서 복원한 행 (이번 실행이 다시 기록할 때까지 보관)
+        self.key = digest.hexdigest()  # 입력 파일 내용 + 작업 설정
+        self.shared = os.path.join(CHECKPOINT_DIR, f"{self.key}.jsonl")
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def previous_of(path):
+        return path[:-len(".jsonl")] + ".prev.jsonl"
+
+    @staticmethod
+    def _read(path):
+        entries = {}
+        if not os.path.exists(path): return entries
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:  # 기록 도중 중단된 마지막 줄
+                    continue
+                entries[entry["index"]] = entry  # 같은 행은 나중 기록 우선
+        return entries
+
+    @staticmethod
+    def _write(path, entries):
+        tmp_path = path + ".part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for index in sorted(entries):
+                f.write(json.dumps(entries[index], ensure_ascii=False, default=str) + "\n")
+        os.replace(tmp_path, path)
+
+    def _entries(self, others=()):
+        # 이 작업의 이전 실행 기록. 없으면 같은 입력/설정의 공유 기록(실패/취소된 작업)과
+        # others(완료되지 않은 다른 작업의 체크포인트: 워커 강제 종료 등으로 공유 기록을 남기지 못한 경우)를 합침
+        if os.path.exists(self.previous) or os.path.exists(self.path):
+            entries = self._read(self.previous)
+            entries.update(self._read(self.path))
+            return entries
+        entries = {}
+        for path in (self.shared, *(p for other in others for p in (self.previous_of(other), other))):
+            for index, entry in self._read(path).items():
+                if index not in entries or entries[index]["result"].get("error"):  # 성공한 결과 우선
+                    entries[index] = entry
+        return entries
+
+    def load(self, others=()):
+        # {행 번호: 결과}. 복원한 행은 previous로 옮기고 이번 실행 기록은 비운 채 시작 -> write_row가 복원 행도 순서대로 다시 기록
+        # 오류로 끝난 행(재시도 소진, 4xx, JSON 파싱 실패)은 재개 시 다시 조회
+        entries = {index: entry for index, entry in self._entries(others).items() if not entry["result"].get("error")}
+        self._write(self.previous, entries)
+        try: os.remove(self.path)
+        except FileNotFoundError: pass
+        return {index: entry["result"] for index, entry in entries.items()}
+
+    def append(self, index, result, sheet=0, context=()):
+        # 행 순서대로 기록됨 -> 진행 중 결과 내보내기(/jobs/<id>/partial, results.ndjson)도 이 파일을 읽음
+        line = json.dumps({"index": index, "sheet": sheet, "context": list(context), "result": result}, ensure_ascii=False, default=str)
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def publish(self):
+        # 실패/취소: 지금까지의 기록을 공유 체크포인트로 저장 (같은 파일을 새 작업으로 다시 제출해도 이어서 처리)
+        try: self._write(self.shared, self._entries())
+        except OSError as e: root_logger.error(f"체크포인트 저장 오류: {e}")
+
+    def remove(self):
+        for path in (self.path, self.previous, self.shared):
+            try: os.remove(path)
+            except FileNotFoundError: pass
+
+# --- 엑셀 입출력 (스트리밍) ---
+RESULT_HEADERS = [ "상품명", "highest_price", "highest_price_product", "highest_price_source",
+    "highest_price_url", "lowest_price", "lowest_price_product", "lowest_price_source", "lowest_price_url",
+    "checked_at", "refreshed", "matched_to", "similarity" ]
+CHECKED_AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _open_sheets(file_path):
+    # 입력 파일의 시트 목록 [(시트 이름, 데이터 행 수, 헤더, 데이터 행 iterator 생성 함수)]과 닫기 함수 반환
+    # .xlsx: 모든 시트(read-only), .xls: xlrd, .csv: 시트 하나 (UTF-8, 실패하면 CP949)
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".csv":
+        for encoding in ("utf-8-sig", "cp949"):
+            try:
+                with open(file_path, newline="", encoding=encoding) as f:
+                    reader = csv.reader(f)
+                    header = next(reader, [])
+                    total = sum(1 for _ in reader)
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            raise ValueError("CSV 파일 인코딩을 알 수 없습니다 (UTF-8 또는 CP949만 지원).")
+
+        def csv_rows():
+            with open(file_path, newline="", encoding=encoding) as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                yield from reader
+        return [("Sheet1", total, header, csv_rows)], lambda: None
+    if extension == ".xls":  # openpyxl은 .xls 미지원
+        import xlrd
+        book = xlrd.open_workbook(file_path, on_demand=True)
+        sheets = []
+        for sheet in (book.sheet_by_index(i) for i in range(book.nsheets)):
+            sheets.append((sheet.name, max(sheet.nrows - 1, 0), sheet.row_values(0) if sheet.nrows else [],
+                           lambda sheet=sheet: (sheet.row_values(r) for r in range(1, sheet.nrows))))
+        return sheets, book.release_resources
+    from openpyxl import load_workbook
+    wb = load_workbook(file_path, read_only=True)
+    sheets = []
+    for ws in wb.worksheets:
+        if ws.max_row is None:  # dimension 정보가 없는 파일은 한 번 훑어서 계산
+            ws.calculate_dimension(force=True)
+        header = next(ws.iter_rows(max_row=1, values_only=True), ())
+        sheets.append((ws.title, max((ws.max_row or 1) - 1, 0), header,
+                       lambda ws=ws: ws.iter_rows(min_row=2, values_only=True)))
+    return sheets, wb.close
+
+def _column_index(header, column, by_position=True):
+    # 열 지정: 헤더 이름, 1부터 시작하는 열 번호, 또는 엑셀 열 문자(A, B, ...)
+    # by_position=False면 헤더 이름으로만 찾음 (다른 시트의 헤더 이름인 "SKU", "ID" 등을 열 문자로 해석하지 않도록)
+    if column in header: return header.index(column)
+    if not by_position: return None
+    if column.isdigit() and int(column) >= 1: return int(column) - 1
+    if re.fullmatch(r"[A-Za-z]{1,3}", column):
+        from openpyxl.utils import column_index_from_string
+        return column_index_from_string(column.upper()) - 1
+    return None
+
+def open_products(file_path, product_column="", context_columns=()):
+    # (전체 행 수, [(시트 이름, 출력 헤더)], (시트 번호, 상품명, 보조 열 값 목록) iterator) 반환
+    # 첫 행은 헤더. product_column을 비우면 첫 번째 열을 상품명으로 사용
+    # context_columns(브랜드, 모델 번호 등)는 검색어에 덧붙이고 결과 파일에도 그대로 기록
+    sheets, close = _open_sheets(file_path)
+    headers = [[str(h).strip() if h is not None else "" for h in header] for _, _, header, _ in sheets]
+    by_position = not any(product_column in header for header in headers)  # 어느 시트의 헤더 이름이면 열 번호/문자로 보지 않음
+    specs, selected = [], []
+    for (title, total, _, rows), header in zip(sheets, headers):
+        index = _column_index(header, product_column, by_position) if product_column else 0
+        if index is None:
+            root_logger.warning(f"'{title}' 시트에 '{product_column}' 열이 없어 건너뜁니다.")
+            continue
+        if index >= len(header):
+            root_logger.warning(f"'{title}' 시트는 {len(header)}열까지만 있어 '{product_column}' 열을 찾을 수 없으므로 건너뜁니다.")
+            continue
+        context = [header.index(column) if column in header else None for column in context_columns]
+        missing = [column for column, c in zip(context_columns, context) if c is None]
+        if missing:
+            names = ", ".join(f"'{column}'" for column in missing)
+            root_logger.warning(f"'{title}' 시트에 보조 열 {names}이(가) 없어 빈 값으로 처리합니다.")
+        specs.append((title, [RESULT_HEADERS[0], *context_columns, *RESULT_HEADERS[1:]]))
+        selected.append((total, index, context, rows))
+    if not selected:
+        close()
+        raise ValueError(f"'{product_column}' 열이 있는 시트가 없습니다.")
+
+    def iter_items():
+        try:
+            for sheet_no, (_, index, context, rows) in enumerate(selected):
+                for row in rows():
+                    value = row[index] if index < len(row) else None
+                    if value is None or value == "": continue
+                    yield sheet_no, value, [row[c] if c is not None and c < len(row) else None for c in context]
+        finally:
+            close()
+    return sum(total for total, _, _, _ in selected), specs, iter_items()
+
+def product_query(product, context=(), alias_rules=()):
+    # 상품명 + 보조 열 값 -> 실제 검색어
+    return clean_product_name(" ".join(str(v) for v in (product, *context) if v is not None and v != ""), alias_rules)
+
+def result_row(res):
+    return [ res.get("product_name"), res.get("highest_price"), res.get("highest_price_product"),
+        res.get("highest_price_source"), res.get("highest_price_url"), res.get("lowest_price"),
+        res.get("lowest_price_product"), res.get("lowest_price_source"), res.get("lowest_price_url"),
+        res.get("checked_at"), res.get("refreshed"), res.get("matched_to"), res.get("similarity") ]
+
+def _parse_checked_at(value):
+    if isinstance(value, datetime.datetime): return value
+    try: return datetime.datetime.strptime(str(value).strip(), CHECKED_AT_FORMAT)
+    except ValueError: return None
+
+def load_baseline(file_path, alias_rules=(), context_columns=()):
+    # 이전 결과 파일(price_results.xlsx, 모든 시트) -> {정규화 검색어: 결과}. 같은 상품이 여러 번 있으면 마지막 행 사용
+    # checked_at 열이 없는 예전 형식은 파일 저장 시각을 조회 시각으로 간주
+    from openpyxl import load_workbook
+    wb = load_workbook(file_path, read_only=True)
+    try:
+        saved_at = wb.properties.modified or wb.properties.created
+        baseline, found = {}, False
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+            columns = [(RESULT_HEADERS.index(h), i) for i, h in enumerate(header) if h in RESULT_HEADERS]
+            if not any(index == 0 for index, _ in columns): continue
+            found = True
+            context = [header.index(column) if column in header else None for column in context_columns]
+            for row in rows:
+                values = dict.fromkeys(RESULT_HEADERS)
+                for index, i in columns:
+                    if i < len(row): values[RESULT_HEADERS[index]] = row[i]
+                if values["상품명"] is None: continue
+                result = {k: values[k] for k in RESULT_HEADERS[1:9]}
+                checked_at = _parse_checked_at(values["checked_at"]) if values["checked_at"] is not None else saved_at
+                result["checked_at"] = checked_at.strftime(CHECKED_AT_FORMAT) if checked_at else None
+                row_context = [row[c] if c is not None and c < len(row) else None for c in context]
+                baseline[product_query(values["상품명"], row_context, alias_rules).casefold()] = result
+        if not found:
+            raise ValueError("기준 파일에 '상품명' 열이 없습니다.")
+        return baseline
+    finally:
+        wb.close()
+
+def is_fresh(result, max_age_days, now=None):
+    # 가격이 모두 있고 조회 시각이 기준 기간 이내인 행만 재사용
+    if result.get("highest_price") is None or result.get("lowest_price") is None: return False
+    checked_at = _parse_checked_at(result.get("checked_at")) if result.get("checked_at") else None
+    if checked_at is None: return False
+    return (now or datetime.datetime.now()) - checked_at <= datetime.timedelta(days=max_age_days)
 
 # --- 백그라운드 작업 (가격 검색) ---
-def background_search(file_path, output_filename, system_prompt, model):
+JOB_PROFILE = os.environ.get("JOB_PROFILE", "") == "1"  # 모든 작업을 cProfile로 프로파일링
+DEDUP_MAX_KEYS = int(os.environ.get("DEDUP_MAX_KEYS", 5000))  # 작업 내 중복 제거용으로 기억할 고유 상품 수 (멀리 떨어진 중복은 캐시로 처리)
+PIPELINE_WINDOW = int(os.environ.get("PIPELINE_WINDOW", 1000))  # 결과 기록 대기 중 최대 행 수
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 20))  # 한 요청에 묶을 수 있는 최대 상품 수
+BASELINE_MAX_AGE_DAYS = float(os.environ.get("BASELINE_MAX_AGE_DAYS", 7))  # 기준 파일 결과를 재사용할 최대 경과 일수
+def background_search(job_id, *args, profile=False, **kwargs):
+    current_job_id.set(job_id)
+    metrics.inc("pps_jobs_queued", -1)
+    metrics.inc("pps_jobs_running")
+    started = time.perf_counter()
+    profilers = [cProfile.Profile()] if profile or JOB_PROFILE else None  # [작업 스레드, 조회 스레드...]
+    if profilers: profilers[0].enable()
+    status = "failed"
     try:
-        df = pd.read_excel(file_path)
-        products = df.iloc[:, 0].tolist()
-
-        results = []
-        total_products = len(products)
-        for i, product in enumerate(products):
-            root_logger.info(f"[{i+1}/{total_products}] {product} 가격 검색 시작...")
-            price_data = search_price_api(product, system_prompt, model)
-            root_logger.info(f"[{i+1}/{total_products}] {product} 가격 검색 완료.")
-            price_data["product_name"] = product
-            results.append(price_data)
-
-        # Excel 파일 생성
-        output = BytesIO()
-        wb = Workbook()
-        ws = wb.active
-        headers = [ "상품명", "highest_price", "highest_price_product", "highest_price_source",
-            "highest_price_url", "lowest_price", "lowest_price_product", "lowest_price_source", "lowest_price_url" ]
-        ws.append(headers)
-        for res in results:
-            ws.append([ res.get("product_name"), res.get("highest_price"), res.get("highest_price_product"),
-                res.get("highest_price_source"), res.get("highest_price_url"), res.get("lowest_price"),
-                res.get("lowest_price_product"), res.get("lowest_price_source"), res.get("lowest_price_url") ])
-        wb.save(output)
-        output.seek(0)
-
-        # 결과 파일 저장 (global 변수 사용)
-        global result_file
-        result_file = output
+        status = "done" if run_search(job_id, *args, profilers=profilers, **kwargs) else \
+            "cancelled" if job_store.get(job_id)["status"] == "cancelled" else "failed"
+    finally:
+        metrics.inc("pps_jobs_running", -1)
+        metrics.inc("pps_jobs_total", status=status)
+        metrics.observe("pps_job_duration_seconds", time.perf_counter() - started, status=status)
+        if profilers: save_profile(job_id, profilers)
+
+def _start_thread_profiler(profilers):
+    profiler = cProfile.Profile()
+    profilers.append(profiler)
+    profiler.enable()
+
+def save_profile(job_id, profilers):
+    # 작업 스레드와 조회 스레드의 프로파일을 합쳐 텍스트 리포트로 저장 (/jobs/<id>/profile)
+    profilers[0].disable()  # disable()은 호출한 스레드 기준이므로 작업 스레드 것을 먼저 종료
+    stats = pstats.Stats(profilers[0], stream=io.StringIO())
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+    stats.sort_stats("cumulative").print_stats(80)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{job_id}.profile.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(stats.stream.getvalue())
+    root_logger.info(f"프로파일 저장: /jobs/{job_id}/profile")
+
+def timed_iter(iterable, name, **labels):
+    # 항목을 꺼내는 데 걸린 시간의 합을 끝에서 한 번 기록
+    elapsed = 0.0
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            elapsed += time.perf_counter() - started
+        yield item
+    metrics.observe(name, elapsed, **labels)
+
+def run_search(job_id, file_path, output_filename, system_prompt, model,
+               concurrency=SEARCH_CONCURRENCY, rpm=JOB_RPM, alias_rules="", batch_size=1, escalation_model="",
+               baseline_path="", max_age_days=BASELINE_MAX_AGE_DAYS, similarity_threshold=SIMILARITY_THRESHOLD,
+               product_column="", context_columns="", priority=JOB_PRIORITY_DEFAULT, profilers=None):
+    scheduled = api_scheduler.register(job_id, priority, job_store.get(job_id)["status"])
+    sheets = []  # 결과 write-only 시트
+    checkpoint = None
+    draining = None  # 취소 후 응답을 기다리는 조회 스레드가 남은 executor
+    try:
+        columns = [column.strip() for column in context_columns.split(",") if column.strip()]
+        with metrics.timer("pps_stage_seconds", stage="read_input"):
+            total_products, sheet_specs, products = open_products(file_path, product_column.strip(), columns)
+        products = timed_iter(products, "pps_stage_seconds", stage="read_input")
+        checkpoint = Checkpoint(job_id, file_path, model, system_prompt, alias_rules, escalation_model, baseline_path, max_age_days,
+                                similarity_threshold, product_column, context_columns)
+        job_store.update(job_id, total=total_products, completed=0, checkpoint=checkpoint.path, checkpoint_key=checkpoint.key,
+                         sheets=json.dumps(sheet_specs, ensure_ascii=False, default=str))
+        restored = checkpoint.load(job_store.journals(checkpoint.key, job_id))
+        if restored:
+            root_logger.info(f"체크포인트에서 {len(restored)}건 복원, 나머지 행부터 재개합니다.")
+        rules = parse_alias_rules(alias_rules)
+        baseline = load_baseline(baseline_path, rules, columns) if baseline_path else {}
+        if baseline_path:
+            root_logger.info(f"기준 파일 {len(baseline)}건 로드 ({max_age_days:g}일 이내 결과 재사용)")
+        checked_now = datetime.datetime.now()
+        limiter = RateLimiter(rpm)  # 작업 하나의 호출 속도만 추가로 줄일 때 사용 (키별 한도와 별개)
+        wait = lambda seconds: api_scheduler.sleep(job_id, seconds)
+        cache_stats = {"hits": 0, "misses": 0, "lock": threading.Lock()}
+        progress = JobProgress(job_id, total_products)
+
+        def lookup_cache(i, query, model_name=model):
+            if price_cache is None: return None
+            cached = price_cache.get(PriceCache.make_key(query, model_name, system_prompt))
+            with cache_stats["lock"]:
+                cache_stats["hits" if cached is not None else "misses"] += 1
+            metrics.inc("pps_cache_requests_total", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                root_logger.info(f"[{i+1}/{total_products}] {query} 캐시 사용.")
+            return cached
+
+        def store_cache(query, price_data, model_name=model):
+            if price_cache is not None and not _is_empty_result(price_data):  # 빈 결과(오류 포함)는 캐시하지 않음
+                price_cache.set(PriceCache.make_key(query, model_name, system_prompt), price_data)
+
+        def query_api(i, query, model_name=model):
+            api_scheduler.check(job_id)
+            limiter.acquire(wait)
+            root_logger.info(f"[{i+1}/{total_products}] {query} 가격 검색 시작 ({model_name})...")
+            started = time.monotonic()
+            with api_scheduler.slot(job_id):
+                price_data = search_price_api(query, system_prompt, model_name)
+            progress.record_latency(time.monotonic() - started, model_name)
+            metrics.observe("pps_stage_seconds", time.monotonic() - started, stage="api")
+            store_cache(query, price_data, model_name)
+            root_logger.info(f"[{i+1}/{total_products}] {query} 가격 검색 완료.")
+            return price_data
+
+        def escalate(i, query, price_data):
+            # 1차 모델 결과의 신뢰도가 낮으면 escalation_model로 한 번 더 조회
+            if not escalation_model or escalation_model == model or not needs_escalation(price_data):
+                return price_data
+            escalated = lookup_cache(i, query, escalation_model)
+            if escalated is None:
+                escalated = query_api(i, query, escalation_model)
+            improved = not _is_empty_result(escalated) and (not needs_escalation(escalated) or _is_empty_result(price_data))
+            progress.record_escalation(improved)
+            return escalated if not _is_empty_result(escalated) or _is_empty_result(price_data) else price_data
+
+        def search_one(i, query):
+            cached = lookup_cache(i, query)
+            return escalate(i, query, cached if cached is not None else query_api(i, query))
+
+        def search_batch(items):
+            # items: [(행 번호, 검색어, future)]. 캐시 미적중 상품만 한 번의 요청으로 묶어서 조회
+            try:
+                misses = []
+                for i, query, future in items:
+                    cached = lookup_cache(i, query)
+                    if cached is not None: future.set_result(escalate(i, query, cached))
+                    else: misses.append((i, query, future))
+                if len(misses) == 1:
+                    i, query, future = misses[0]
+                    future.set_result(escalate(i, query, query_api(i, query)))
+                if len(misses) <= 1: return
+                api_scheduler.check(job_id)
+                limiter.acquire(wait)
+                first = misses[0][0]
+                root_logger.info(f"[{first+1}/{total_products}] {len(misses)}개 상품 배치 검색 시작...")
+                started = time.monotonic()
+                with api_scheduler.slot(job_id):
+                    batch_results = search_price_batch_api([query for _, query, _ in misses], system_prompt, model)
+                progress.record_latency(time.monotonic() - started, model)
+                metrics.observe("pps_stage_seconds", time.monotonic() - started, stage="api")
+                fallback = 0
+                for i, query, future in misses:
+                    price_data = batch_results.get(normalize_product_name(query))
+                    if price_data is None:  # 배치 응답에서 누락/형식 오류 -> 단건 조회
+                        fallback += 1
+                        price_data = query_api(i, query)
+                    else:
+                        store_cache(query, price_data)
+                    future.set_result(escalate(i, query, price_data))
+                root_logger.info(f"[{first+1}/{total_products}] 배치 검색 완료 ({len(misses) - fallback}/{len(misses)}건 성공, 단건 재조회 {fallback}건)")
+            except BaseException as e:
+                for _, _, future in items:
+                    if not future.done(): future.set_exception(e)
+
+        def write_row(i, item, key, source):
+            # item: (시트 번호, 상품명, 보조 열 값)
+            # source: None(체크포인트 복원), Future(조회 중), dict(앞서 기록된 같은 상품 또는 기준 파일의 결과)
+            sheet_no, product, context = item
+            if source is None:
+                result = restored.pop(i)  # 이번 실행 기록에도 순서대로 다시 남김 (진행 중 결과 내보내기에 포함)
+            else:
+                shared = api_scheduler.result(job_id, source) if isinstance(source, Future) else source
+                if queries.get(key) is source:
+                    queries[key] = shared  # 완료된 Future 대신 결과만 보관 (메모리 절약)
+                result = dict(shared)  # 중복 행끼리 같은 결과 공유 -> 복사 후 상품명 기록
+                result["product_name"] = product
+                result.setdefault("refreshed", True)  # 기준 파일에서 가져온 행만 False
+                result.setdefault("checked_at", checked_now.strftime(CHECKED_AT_FORMAT))
+                if key in matched:  # 조회하지 않고 비슷한 상품명의 결과를 사용한 행
+                    result["matched_to"], result["similarity"] = matched[key]
+            checkpoint.append(i, result, sheet_no, context)
+            started = time.perf_counter()
+            row = result_row(result)
+            sheets[sheet_no].append([row[0], *context, *row[1:]])
+            write_time[0] += time.perf_counter() - started
+            progress.record_row(result, restored=source is None, carried=result.get("refreshed") is False,
+                                matched=source is not None and key in matched)
+
+        # 결과는 write-only 워크북으로 임시 파일에 바로 기록 (입력 시트 구성과 행 순서 유지)
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{job_id}.xlsx")
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        for title, header in sheet_specs:
+            sheets.append(wb.create_sheet(title))
+            sheets[-1].append(header)
+        write_time = [0.0]  # 결과 기록(openpyxl)에 걸린 시간
+
+        # 진행 중인 future 수를 제한해 메모리 사용량을 행 수와 무관하게 유지
+        # (재시도 대기 중인 행이 결과 기록을 막아도 나머지 행은 계속 조회되도록 여유 있게 설정)
+        window = max(PIPELINE_WINDOW, max(1, concurrency) * max(1, batch_size) * 4)
+        pending = deque()
+        queries = OrderedDict()  # 정규화 키 -> Future 또는 결과 (같은 상품은 한 번만 조회)
+        matched = {}  # 정규화 키 -> (비슷한 상품명, 유사도)
+        similar = None
+        if similarity_threshold > 0:
+            similar = SimilarityIndex(similarity_threshold)
+            for name, cached in price_cache.recent(model, system_prompt, SIMILARITY_MAX_ENTRIES)[::-1] if price_cache is not None else ():
+                similar.add(name, cached)
+        saved = 0
+        batch = []
+
+        def flush_batch():
+            if batch:
+                executor.submit(contextvars.copy_context().run, search_batch, list(batch))
+                batch.clear()
+
+        executor_options = {"initializer": _start_thread_profiler, "initargs": (profilers,)} if profilers else {}
+        executor = ThreadPoolExecutor(max_workers=max(1, concurrency), **executor_options)
+        try:
+            # 모든 시트의 행을 한 흐름으로 제출 -> 앞 시트의 결과를 기다리는 동안 다음 시트 행도 함께 조회됨
+            for i, item in enumerate(products):
+                api_scheduler.check(job_id)
+                if i in restored:
+                    pending.append((i, item, None, None))
+                else:
+                    query = product_query(item[1], item[2], rules)
+                    key = query.casefold()
+                    future = queries.get(key)
+                    carried = baseline.get(key)
+                    fresh = future is None and carried is not None and is_fresh(carried, max_age_days, checked_now)
+                    match = similar.match(key) if similar is not None and future is None and not fresh else None
+                    if fresh:
+                        future = dict(carried, refreshed=False)  # 최근 결과 -> 조회 없이 그대로 사용
+                        queries[key] = future
+                        if len(queries) > DEDUP_MAX_KEYS: queries.popitem(last=False)
+                        if similar is not None: similar.add(key, future)
+                    elif match is not None and match[0] != key:  # 같은 이름은 일반 캐시 조회로 처리
+                        future = match[2]  # 비슷한 상품명의 결과(또는 조회 중인 Future)를 공유
+                        matched[key] = (match[0], round(match[1], 3))
+                        queries[key] = future
+                        if len(queries) > DEDUP_MAX_KEYS: queries.popitem(last=False)
+                    elif future is None:
+                        if batch_size > 1:
+                            future = Future()
+                            batch.append((i, query, future))
+                            if len(batch) >= batch_size: flush_batch()
+                        else:
+                            future = executor.submit(contextvars.copy_context().run, search_one, i, query)
+                        queries[key] = future
+                        if len(queries) > DEDUP_MAX_KEYS: queries.popitem(last=False)
+                        if similar is not None: similar.add(key, future)
+                    else:
+                        saved += 1
+                        queries.move_to_end(key)
+                    pending.append((i, item, key, future))
+                while len(pending) >= window:
+                    if any(future is pending[0][3] for _, _, future in batch):
+                        flush_batch()  # 기다릴 결과가 아직 실행 전인 배치에 있으면 먼저 실행
+                    write_row(*pending.popleft())
+            flush_batch()
+            while pending:
+                api_scheduler.check(job_id)
+                write_row(*pending.popleft())
+        finally:
+            # 취소/오류로 빠져나오면 아직 시작하지 않은 조회는 버림
+            # 취소면 이미 보낸 요청의 응답(최대 API_TIMEOUT)을 기다리지 않고 바로 작업 자리를 비움 (남은 스레드는 finally에서 정리)
+            cancelled = api_scheduler.state(job_id) == "cancelled"
+            executor.shutdown(wait=not cancelled, cancel_futures=True)
+            if cancelled: draining = executor
+        progress.total = progress.completed  # 빈 행 제외한 실제 처리 건수
+        progress.emit()
+        job_store.update(job_id, total=progress.total)
+        if saved:
+            root_logger.info(f"중복 상품 정리로 API 호출 {saved}건 절약")
+        if similar is not None:
+            root_logger.info(f"유사 상품명 결과 재사용 {progress.matched}건 (유사도 {similarity_threshold} 이상)")
+        if baseline_path:
+            root_logger.info(f"기준 파일 결과 재사용 {progress.carried}건 / 새로 조회 {progress.completed - progress.carried - progress.restored}건")
+        if price_cache is not None:
+            root_logger.info(f"캐시 적중 {cache_stats['hits']}건 / 미적중 {cache_stats['misses']}건")
+        for tier_model, tier in progress.snapshot()["tiers"].items():
+            root_logger.info(f"모델 {tier_model}: API 호출 {tier['calls']}건, 평균 {tier['latency_avg']}초 / p95 {tier['latency_p95']}초")
+        if escalation_model:
+            root_logger.info(f"{escalation_model} 재조회 {progress.escalated}건 중 {progress.escalation_improved}건 개선")
+
+        tmp_output = output + ".part"
+        started = time.perf_counter()
+        wb.save(tmp_output)
+        metrics.observe("pps_stage_seconds", write_time[0] + time.perf_counter() - started, stage="write_output")
+        os.replace(tmp_output, output)
+
+        if not job_store.finish(job_id, output):  # 마지막 행 이후에 취소됨 -> 취소 상태 유지
+            raise JobCancelled("사용자가 작업을 취소했습니다.")
         root_logger.info("가격 검색 완료.") # 완료 로그
 
+    except JobCancelled as e:
+        job_store.update(job_id, status="cancelled", error=str(e))
+        if checkpoint is not None: checkpoint.publish()
+        root_logger.warning(f"가격 검색 취소됨 ({progress.completed}건 완료, /jobs/{job_id}/partial 로 받을 수 있음)")
+        return False
     except Exception as e:
+        # 업로드 파일과 체크포인트는 남겨 두고 /jobs/<id>/resume 으로 재개
+        job_store.update(job_id, status="failed", error=str(e))
+        if checkpoint is not None: checkpoint.publish()
         root_logger.error(f"가격 검색 중 오류 발생: {e}")
+        return False
     finally:
-        try: os.remove(file_path)
+        if draining is None:
+            api_scheduler.unregister(job_id, scheduled)
+        else:  # 먼저 해제하면 남은 스레드의 호출이 취소되지 않은 새 작업으로 등록되어 요청이 나감
+            threading.Thread(target=lambda: (draining.shutdown(), api_scheduler.unregister(job_id, scheduled)), daemon=True).start()
+        for ws in sheets:
+            if not ws.closed: ws.close()  # 실패/취소로 저장하지 못한 시트의 임시 파일 정리
+
+    checkpoint.remove()
+    submitted = job_store.get(job_id)["created_at"]
+    for path in filter(None, (file_path, baseline_path)):
+        if job_store.file_in_use(path, job_id): continue  # 같은 파일을 다시 올린 다른 작업이 사용 중
+        if uploaded_since(path, submitted): continue  # 작업 등록 후 다시 올라옴 (아직 /search 전일 수 있음)
+        try: os.remove(path)
         except Exception as e: root_logger.error(f"임시 파일 삭제 오류: {e}")
+    return True
 
-# --- Flask 라우트 ---
-result_file = None  # 결과 파일을 저장할 전역 변수, 초기화
-search_thread = None # 스레드 전역변수 추가
+# --- 진행 중 결과 내보내기 (부분 다운로드, NDJSON 스트림) ---
+# 실행 중인 작업의 메모리 상태는 건드리지 않고, 완료된 행이 순서대로 쌓이는 체크포인트 JSONL만 읽음 (큐 모드 워커 작업도 동일)
+# 완료된 작업은 체크포인트가 삭제되므로 결과 파일에서 읽음
+RESULT_STREAM_POLL = float(os.environ.get("RESULT_STREAM_POLL", 1.0))  # NDJSON 스트림에서 새 행을 확인하는 간격(초)
+JOB_ACTIVE_STATUSES = ("queued", "running", "paused")  # 스트림을 이어서 기다리는 상태 (일시정지된 작업도 재개되면 행이 더 나옴)
+
+def _checkpoint_rows(f, context_count, active=None):
+    # 체크포인트 줄 -> (행 번호, 시트 번호, 출력 행). active: 작업이 아직 진행 중인지 확인하는 함수 (None이면 지금까지 기록된 행만)
+    # 작업이 재개되면 Checkpoint.load가 같은 경로에 새 파일을 만들고 복원 행부터 다시 기록하므로,
+    # 기다리는 동안 파일이 바뀌었으면 다시 열고 이미 보낸 행은 건너뜀 (행은 번호 순서대로 기록됨)
+    buffered, finished, last = "", False, -1
+    try:
+        while True:
+            line = f.readline()
+            if line.endswith("\n"):
+                line, buffered = buffered + line, ""
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:  # 중단된 이전 실행이 남긴 깨진 줄
+                    continue
+                if entry["index"] <= last: continue
+                last = entry["index"]
+                row = result_row(entry["result"])
+                context = (entry.get("context") or [])[:context_count]
+                context += [None] * (context_count - len(context))
+                yield entry["index"], entry.get("sheet", 0), [row[0], *context, *row[1:]]
+                continue
+            buffered += line  # 기록 중인 마지막 줄은 다음 읽기에서 이어 붙임
+            if active is None or finished: return
+            if _file_replaced(f):
+                f.close()
+                f, buffered = open(f.name, encoding="utf-8"), ""
+                continue
+            finished = not active()  # 종료를 확인한 뒤 남은 줄을 한 번 더 읽고 끝냄
+            if not finished: time.sleep(RESULT_STREAM_POLL)
+    finally:
+        f.close()
+
+def _file_replaced(f):
+    # 열어 둔 파일이 삭제/교체되어 같은 경로에 다른 파일이 생겼는지 (아직 새 파일이 없으면 False)
+    try: return os.stat(f.name).st_ino != os.fstat(f.fileno()).st_ino
+    except FileNotFoundError: return False
 
+def _result_file_rows(path):
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True)
+    try:
+        index = 0
+        for sheet_no, ws in enumerate(wb.worksheets):
+            for row in ws.iter_rows(min_row=2, values_only=True):
+                yield index, sheet_no, list(row)
+                index += 1
+    finally:
+        wb.close()
+
+def iter_job_rows(job, follow=False):
+    # 작업의 완료된 행을 순서대로 (행 번호, 시트 번호, 출력 행)으로 반환. follow=True면 작업이 끝날 때까지 새 행을 기다림
+    while True:
+        if job["status"] == "done":
+            if job["result_path"] and os.path.exists(job["result_path"]):
+                yield from _result_file_rows(job["result_path"])
+            return
+        try:
+            f = open(job["checkpoint"] or "", encoding="utf-8")
+            break
+        except FileNotFoundError:  # 아직 완료된 행이 없거나, 그 사이 작업이 끝나 체크포인트가 삭제됨
+            pass
+        latest = job_store.get(job["id"])
+        if latest["status"] != "done":
+            if not follow or latest["status"] not in JOB_ACTIVE_STATUSES: return
+            time.sleep(RESULT_STREAM_POLL)
+        job = latest
+    context_count = len(job["sheets"][0][1]) - len(RESULT_HEADERS) if job["sheets"] else 0
+    active = (lambda: job_store.get(job["id"])["status"] in JOB_ACTIVE_STATUSES) if follow else None
+    yield from _checkpoint_rows(f, context_count, active)  # f는 _checkpoint_rows가 닫음
+
+def write_partial_xlsx(job, sheets, path):
+    # 지금까지 완료된 행을 path에 엑셀로 저장하고 행 수를 반환
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    out_sheets = []
+    for title, header in sheets:
+        out_sheets.append(wb.create_sheet(title))
+        out_sheets[-1].append(header)
+    rows = 0
+    for _, sheet_no, row in iter_job_rows(job):
+        out_sheets[sheet_no].append(row)
+        rows += 1
+    wb.save(path)
+    return rows
+
+def run_blocking(function, *args):
+    # CPU를 오래 쓰는 함수를 실제 OS 스레드에서 실행하고 결과를 기다림
+    # gevent monkey patch 환경에서는 threading 스레드도 greenlet이라 이벤트 루프 전체가 멈추므로 gevent 허브의 스레드 풀 사용
+    try:
+        from gevent import get_hub, monkey
+    except ImportError:
+        return function(*args)
+    if not monkey.is_module_patched("threading"):
+        return function(*args)
+    return get_hub().threadpool.apply(function, args)
+
+def export_filename(job, extension):
+    stem = os.path.splitext(job["output_filename"] or "result")[0]
+    return f"{stem}.partial{extension}" if job["status"] != "done" else f"{stem}{extension}"
+
+# --- 업로드 (내용 해시 스풀 파일) ---
+# multipart 파싱 중 청크를 바로 디스크에 쓰면서 SHA-256 계산 -> 메모리 버퍼링/재읽기 없이
+# UPLOAD_DIR/<해시>.<확장자> 로 저장. 같은 내용을 다시 올리면 기존 파일을 그대로 사용
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "./tmp")
+UPLOAD_MAX_BYTES = int(float(os.environ.get("UPLOAD_MAX_MB", 50)) * 1024 * 1024)
+UPLOAD_NAME = re.compile(r"[0-9a-f]{64}\.[a-z]+")
+
+class SpoolFile:
+    def __init__(self, max_bytes):
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        self.path = os.path.join(UPLOAD_DIR, f".{uuid.uuid4().hex}.part")
+        self.file = open(self.path, "w+b")
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.close()
+            raise RequestEntityTooLarge(f"파일 크기는 {self.max_bytes // (1024 * 1024)}MB 이하여야 합니다.")
+        self.digest.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):  # read/seek 등은 실제 파일로 위임
+        return getattr(self.file, name)
+
+    def commit(self, extension):
+        self.file.close()
+        path = os.path.join(UPLOAD_DIR, self.digest.hexdigest() + extension)
+        try:
+            os.utime(path)  # 중복 업로드 -> 기존 파일 사용. 수정 시각을 갱신해서 먼저 올린 작업의 정리 대상에서 제외
+            os.remove(self.path)
+        except FileNotFoundError:
+            os.replace(self.path, path)
+        self.path = None
+        return path
+
+    def close(self):
+        # commit 되지 않은 스풀 파일(프롬프트 업로드, 오류 등)은 요청 종료 시 삭제
+        self.file.close()
+        if self.path and os.path.exists(self.path): os.remove(self.path)
+
+class SpoolRequest(Request):
+    max_content_length = UPLOAD_MAX_BYTES + 1024 * 1024  # multipart 헤더/폼 필드 여유분
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpoolFile(UPLOAD_MAX_BYTES)
+
+app.request_class = SpoolRequest
+
+def file_digest(file_path):
+    # 스풀 파일은 파일명이 곧 내용 해시 -> 다시 읽지 않음
+    name = os.path.basename(file_path)
+    if UPLOAD_NAME.fullmatch(name):
+        return name.split(".")[0]
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def is_upload_path(path):
+    # /upload 로 저장된 파일(UPLOAD_DIR/<해시>.<확장자>)인지. 작업이 끝나면 입력/기준 파일을 삭제하므로 그 밖의 경로는 받지 않음
+    return bool(path) and UPLOAD_NAME.fullmatch(os.path.basename(path)) is not None and \
+        os.path.dirname(os.path.abspath(path)) == os.path.abspath(UPLOAD_DIR)
+
+def uploaded_since(path, since):
+    # 같은 내용을 다시 올리면 SpoolFile.commit 이 수정 시각을 갱신함
+    try: return os.path.getmtime(path) >= since
+    except OSError: return False
+
+# --- 작업 큐 워커 (JOB_BACKEND=queue) ---
+# 웹 프로세스는 jobs.db에 작업을 넣기만 하고, worker.py 프로세스들이 하나씩 가져가 실행
+# 워커의 로그/progress 이벤트는 job_logs 테이블을 거쳐 웹 프로세스의 /logs 구독자에게 전달
+WORKER_POLL_INTERVAL = float(os.environ.get("WORKER_POLL_INTERVAL", 1.0))  # 대기 작업 확인 간격(초)
+LOG_FORWARD_INTERVAL = float(os.environ.get("LOG_FORWARD_INTERVAL", 0.2))  # 로그 일괄 기록/읽기 간격(초)
+LOG_RETENTION_SECONDS = float(os.environ.get("LOG_RETENTION_SECONDS", 24 * 3600))
+WORKER_STATS_INTERVAL = float(os.environ.get("WORKER_STATS_INTERVAL", 5.0))  # 워커 메트릭/키 사용량을 jobs.db에 기록하는 간격(초)
+
+class LogForwarder:
+    # 로그를 모아서 LOG_FORWARD_INTERVAL마다 한 트랜잭션으로 기록 (행마다 DB 쓰기 방지)
+    def __init__(self, store):
+        self.store = store
+        self.buffer = deque()
+        self.lock = threading.Lock()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def __call__(self, job_id, message, event=None):
+        with self.lock:
+            self.buffer.append((job_id, message, event))
+
+    def flush(self):
+        with self.lock:
+            entries, self.buffer = list(self.buffer), deque()
+        if entries: self.store.append_logs(entries)
+
+    def run(self):
+        while True:
+            time.sleep(LOG_FORWARD_INTERVAL)
+            try: self.flush()
+            except Exception as e: print(f"로그 전달 오류: {e}")  # 로깅하면 다시 전달 대상이 되므로 출력만
+
+_log_tailer_lock = threading.Lock()
+_log_tailer = None
+
+def start_log_tailer():
+    # 웹 프로세스: job_logs에 새로 기록된 로그를 읽어 이 프로세스의 구독자에게 전달 (최초 /logs 요청 시 시작)
+    global _log_tailer
+    with _log_tailer_lock:
+        if _log_tailer is not None: return
+
+        def run():
+            last_id = None
+            while True:
+                rows = []
+                try:
+                    rows = job_store.logs_since(last_id, LOG_HISTORY_SIZE if last_id is None else 1000)
+                    for last_id, job_id, message, event in rows:
+                        log_broadcaster.publish(job_id, message, event)
+                    if last_id is None: last_id = 0
+                except Exception as e:
+                    root_logger.error(f"로그 읽기 오류: {e}")
+                if len(rows) < 1000: time.sleep(LOG_FORWARD_INTERVAL)
+        _log_tailer = threading.Thread(target=run, daemon=True)
+        _log_tailer.start()
+
+def run_worker():
+    # 대기 작업을 가져와 프로세스당 최대 MAX_CONCURRENT_JOBS개까지 동시에 실행 (자리가 차 있어도 더 급한 작업은 바로 시작)
+    # SIGTERM/SIGINT를 받으면 실행 중인 작업을 대기 상태로 되돌려 다른 워커가 체크포인트부터 이어서 실행
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    forwarder = LogForwarder(job_store)
+    log_broadcaster.forward = forwarder
+    active = {}  # job_id -> Future
+    priorities = {}  # job_id -> 우선순위
+    last_heartbeat = last_stats = 0.0
+
+    def save_stats():
+        # 웹 프로세스의 /metrics, /api_keys 에서 이 워커의 값도 보이도록
+        job_store.save_worker_stats(worker, metrics.dump(), api_keys.snapshot())
+
+    stopping = False
+
+    def shutdown(signum, frame):
+        # 신호 처리기는 메인 스레드의 아무 지점(job_store/forwarder 락을 잡은 채)에서나 실행될 수 있으므로
+        # 플래그만 세우고, 대기 상태 되돌리기/로그 전송/통계 저장은 메인 루프에서 처리
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    root_logger.info(f"워커 {worker} 시작 (동시 작업 {MAX_CONCURRENT_JOBS}개)")
+    while not stopping:
+        for job_id, future in list(active.items()):
+            if future.done():
+                del active[job_id]
+                del priorities[job_id]
+        for job_id, status in job_store.statuses(list(active)).items():
+            api_scheduler.set_state(job_id, status)  # 웹 프로세스에서 바꾼 일시정지/재개/취소를 반영
+        if time.monotonic() - last_stats > WORKER_STATS_INTERVAL:
+            last_stats = time.monotonic()
+            save_stats()
+        threshold = None if stopping else start_priority(list(priorities.values()))
+        job_id = job_store.claim(worker, JOB_STALE_SECONDS, threshold) if threshold is not None else None
+        if job_id is not None:
+            metrics.inc("pps_jobs_queued")
+            params = job_store.get(job_id)["params"]
+            priorities[job_id] = params.get("priority", JOB_PRIORITY_DEFAULT)
+            active[job_id] = (priority_executor if threshold else job_executor).submit(background_search, job_id, **params)
+            continue
+        if time.monotonic() - last_heartbeat > JOB_STALE_SECONDS / 5:  # 재시도 대기 등으로 진행 기록이 없어도 점유 유지
+            last_heartbeat = time.monotonic()
+            job_store.heartbeat(list(active))
+            job_store.prune_logs(time.time() - LOG_RETENTION_SECONDS)
+            job_store.prune_worker_stats(time.time() - LOG_RETENTION_SECONDS)
+        time.sleep(WORKER_POLL_INTERVAL)  # 신호를 받으면 남은 시간만큼 더 잔 뒤 종료 (최대 WORKER_POLL_INTERVAL 지연)
+
+    try:
+        for job_id, future in active.items():
+            if future.done(): continue
+            state = api_scheduler.state(job_id) or "running"  # 일시정지/취소 상태는 그대로 유지
+            job_store.update(job_id, status="queued" if state == "running" else state, worker=None)
+        forwarder.flush()
+        save_stats()
+    finally:
+        os._exit(0)  # 실행 중인 작업 스레드를 기다리지 않고 종료
+
+# --- Flask 라우트 ---
 @app.route("/", methods=["GET"])
 def index():
     default_system_prompt = get_default_system_prompt()
@@ -148,65 +2177,255 @@ def upload_file():
     file = request.files["file"]
     if file.filename == "":
         return jsonify({"message": "파일이 선택되지 않았습니다."}), 400
-    if not file.filename.endswith((".xlsx", ".xls")):
-        return jsonify({"message": "엑셀 파일만 업로드 가능합니다."}), 400
+    if not file.filename.lower().endswith((".xlsx", ".xls", ".csv")):
+        return jsonify({"message": "엑셀 또는 CSV 파일만 업로드 가능합니다."}), 400
 
-    # 파일 저장 (임시 파일)
-    file_path = os.path.join("./tmp", file.filename)
-    os.makedirs("./tmp", exist_ok=True)
-    file.save(file_path)
+    # 업로드 중 이미 스풀 파일로 저장됨 -> 내용 해시 이름으로 확정
+    file_path = file.stream.commit(os.path.splitext(file.filename)[1].lower())
     return jsonify({"message": "파일 업로드 성공", "file_path": file_path})
 
 @app.route("/search", methods=["POST"])
 def start_search():
-    global search_thread  # 전역 변수 사용
-
     file_path = request.form.get("file_path")
     output_filename = request.form.get("output_filename", "price_results.xlsx")
     if not output_filename.endswith((".xlsx", ".xls")):
         output_filename += ".xlsx"
     system_prompt = request.form.get("system_prompt", get_default_system_prompt())
     model = request.form.get("model", "sonar")
+    try:
+        concurrency = min(max(int(request.form.get("concurrency", SEARCH_CONCURRENCY)), 1), MAX_CONCURRENT_API_CALLS)  # 전체 API 동시 호출 수 이상은 의미 없음
+        rpm = float(request.form.get("rpm") or JOB_RPM)
+        batch_size = min(max(int(request.form.get("batch_size", 1)), 1), MAX_BATCH_SIZE)
+        max_age_days = float(request.form.get("max_age_days") or BASELINE_MAX_AGE_DAYS)
+        similarity_threshold = min(max(float(request.form.get("similarity_threshold") or SIMILARITY_THRESHOLD), 0.0), 1.0)
+        priority = min(max(int(request.form.get("priority") or JOB_PRIORITY_DEFAULT), 1), JOB_PRIORITY_MAX)
+    except ValueError:
+        return jsonify({"message": "동시 실행 수 / 분당 요청 수 / 배치 크기 / 재사용 기간 / 유사도 기준 / 우선순위는 숫자여야 합니다."}), 400
+    baseline_path = request.form.get("baseline_path", "")
+    if baseline_path and not (is_upload_path(baseline_path) and os.path.exists(baseline_path)):
+        return jsonify({"message": "기준 파일을 찾을 수 없습니다. /upload 로 올린 파일만 사용할 수 있습니다."}), 400
 
     if not file_path:
         return jsonify({"message": "파일 경로가 없습니다."}), 400
+    if not is_upload_path(file_path):
+        return jsonify({"message": "/upload 로 올린 파일만 사용할 수 있습니다."}), 400
+    if not os.path.exists(file_path):
+        return jsonify({"message": "업로드 파일을 찾을 수 없습니다. 다시 올려 주세요."}), 400
+
+    # 작업 등록 후 스케줄러에서 실행 (동시 실행 작업 수 초과 시 대기)
+    job_id = job_store.create(output_filename, {"file_path": file_path, "output_filename": output_filename,
+        "system_prompt": system_prompt, "model": model, "concurrency": concurrency, "rpm": rpm,
+        "alias_rules": request.form.get("alias_rules", ""), "batch_size": batch_size,
+        "profile": request.form.get("profile") in ("1", "true", "on"),
+        "escalation_model": request.form.get("escalation_model", ""),
+        "baseline_path": baseline_path, "max_age_days": max_age_days, "similarity_threshold": similarity_threshold,
+        "product_column": request.form.get("product_column", ""), "context_columns": request.form.get("context_columns", ""),
+        "priority": priority})
+    submit_job(job_id)
+
+    return jsonify({"message": "가격 검색 시작됨", "job_id": job_id})
+
+@app.route("/jobs/<job_id>/resume", methods=["POST"])
+def resume_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"message": "작업을 찾을 수 없습니다."}), 404
+    if job["status"] == "done":
+        return jsonify({"message": "이미 완료된 작업입니다."}), 409
+    if job["status"] == "paused" and job_is_live(job):  # 실행 도중 일시정지된 작업 -> 그 자리에서 계속
+        job_store.update(job_id, status="running")
+        api_scheduler.set_state(job_id, "running")
+        return jsonify({"message": "작업 재개됨", "job_id": job_id})
+    if job["status"] in ("queued", "running") and time.time() - job["updated_at"] < JOB_STALE_SECONDS:
+        return jsonify({"message": "작업이 진행 중입니다."}), 409
+    if not is_upload_path(job["params"].get("file_path")) or not os.path.exists(job["params"]["file_path"]):
+        return jsonify({"message": "업로드 파일이 없어 재개할 수 없습니다."}), 410
+    if job["params"].get("baseline_path") and not (is_upload_path(job["params"]["baseline_path"]) and os.path.exists(job["params"]["baseline_path"])):
+        return jsonify({"message": "기준 파일이 없어 재개할 수 없습니다."}), 410
+    submit_job(job_id)
+    return jsonify({"message": "작업 재개됨", "job_id": job_id})
 
-    # 이미 실행 중인 스레드가 있으면 중지
-    if search_thread and search_thread.is_alive():
-        return jsonify({"message": "이미 검색이 진행 중입니다."}), 409  # 409 Conflict
+def job_is_live(job):
+    # 작업이 지금 어떤 프로세스에서 실행 중인지 (inline: 이 프로세스, queue: 하트비트가 살아 있는 워커)
+    if api_scheduler.state(job["id"]) is not None: return True
+    return JOB_BACKEND == "queue" and bool(job["worker"]) and time.time() - job["updated_at"] < JOB_STALE_SECONDS
 
-    # 백그라운드 스레드에서 가격 검색 실행
-    search_thread = threading.Thread(target=background_search, args=(file_path, output_filename, system_prompt, model))
-    search_thread.start()
+@app.route("/jobs/<job_id>/pause", methods=["POST"])
+def pause_job(job_id):
+    # 실행 중이면 새 API 호출을 멈추고(진행 중인 호출은 마무리) 결과 기록도 멈춤. 대기 중이면 시작하지 않음
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"message": "작업을 찾을 수 없습니다."}), 404
+    if job["status"] not in ("queued", "running"):
+        return jsonify({"message": f"일시정지할 수 없는 상태입니다 ({job['status']})."}), 409
+    job_store.update(job_id, status="paused")
+    api_scheduler.set_state(job_id, "paused")  # queue 모드에서는 워커가 jobs.db를 확인해 반영
+    return jsonify({"message": "작업 일시정지됨", "job_id": job_id})
 
-    return jsonify({"message": "가격 검색 시작됨"})
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    # 아직 보내지 않은 API 호출(재시도 포함)은 바로 중단. 완료된 행은 /jobs/<id>/partial 로 받을 수 있음
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"message": "작업을 찾을 수 없습니다."}), 404
+    if job["status"] not in ("queued", "running", "paused"):
+        return jsonify({"message": f"취소할 수 없는 상태입니다 ({job['status']})."}), 409
+    job_store.update(job_id, status="cancelled", error="사용자가 작업을 취소했습니다.")
+    api_scheduler.set_state(job_id, "cancelled")
+    return jsonify({"message": "작업 취소됨", "job_id": job_id})
+
+@app.route("/jobs", methods=["GET"])
+def list_jobs():
+    jobs = job_store.list()
+    for job in jobs: job.pop("params")
+    return jsonify({"jobs": jobs})
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"message": "작업을 찾을 수 없습니다."}), 404
+    job["progress"] = job["completed"] / job["total"] if job["total"] else 0
+    return jsonify(job)
 
 @app.route("/logs")
 def stream_logs():
-    def generate():
-        while True:
-            try:
-                message = log_queue.get(timeout=1) # 큐가 비어있을 때, 1초 기다림.
-                yield f"data: {message}\n\n"
-            except Empty:
-                yield f"data: \n\n"  # Keep-alive
-
-    return Response(generate(), mimetype='text/event-stream')
+    if JOB_BACKEND == "queue": start_log_tailer()
+    subscriber = log_broadcaster.subscribe(request.args.get("job_id"))
 
-@app.route("/download")
-def download_file():
-    global result_file
-    if result_file:
-        response = send_file(result_file, download_name="price_results.xlsx", as_attachment=True)
+    def generate():
+        try:
+            yield ": connected\n\n"  # 응답 헤더를 바로 보내 연결 확립 (첫 로그까지 기다리지 않음)
+            while True:
+                messages, dropped = subscriber.pop_all(timeout=LOG_KEEPALIVE_SECONDS)
+                if dropped:
+                    yield f"data: ... 로그 {dropped}건 생략 ...\n\n"
+                for event, message in messages:
+                    prefix = f"event: {event}\n" if event else ""
+                    yield prefix + "".join(f"data: {line}\n" for line in message.splitlines() or [""]) + "\n"
+                if not messages:
+                    yield ": keep-alive\n\n"  # SSE 주석 (브라우저에 표시되지 않음)
+        finally:
+            log_broadcaster.unsubscribe(subscriber)
 
-        # BytesIO 객체 닫고, 메모리 해제.
-        result_file.close()
-        result_file = None # 다운로드 후 초기화
+    return Response(generate(), mimetype='text/event-stream', headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-        return response
+@app.route("/jobs/<job_id>/download")
+def download_file(job_id):
+    job = job_store.get(job_id)
+    if job and job["status"] == "done" and job["result_path"] and os.path.exists(job["result_path"]):
+        # 디스크에서 바로 전송 (Range/If-None-Match 지원, 이어받기 가능)
+        return send_file(os.path.abspath(job["result_path"]), download_name=job["output_filename"], as_attachment=True,
+                         conditional=True)
     else:
         return "No result file available", 404
 
+@app.route("/jobs/<job_id>/partial")
+def download_partial(job_id):
+    # 진행 중(또는 실패한) 작업에서 지금까지 완료된 행만 담은 파일. ?format=csv 이면 CSV (시트가 여러 개면 sheet 열 추가)
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"message": "작업을 찾을 수 없습니다."}), 404
+    extension = "." + request.args.get("format", "xlsx").lower()
+    if extension not in (".xlsx", ".csv"):
+        return jsonify({"message": "format은 xlsx 또는 csv만 지원합니다."}), 400
+    if job["status"] == "done" and extension == ".xlsx":
+        return download_file(job_id)
+    sheets = job["sheets"] or [["Sheet1", RESULT_HEADERS]]
+
+    if extension == ".csv":
+        def generate():
+            buffer = io.StringIO()
+            buffer.write("\ufeff")  # 엑셀에서 열 때 UTF-8로 인식되도록 BOM
+            writer = csv.writer(buffer)
+            writer.writerow((["sheet"] if len(sheets) > 1 else []) + list(sheets[0][1]))
+            for _, sheet_no, row in iter_job_rows(job):
+                writer.writerow(([sheets[sheet_no][0]] if len(sheets) > 1 else []) + row)
+                if buffer.tell() > 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        return Response(generate(), mimetype="text/csv",
+                        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(export_filename(job, extension))}"})
+
+    # 큰 작업은 엑셀 생성에 수 초~수십 초 CPU를 쓰므로 이벤트 루프 밖 OS 스레드에서 임시 파일로 만든 뒤 나눠서 전송
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f".partial-{uuid.uuid4().hex}.xlsx")
+    try:
+        rows = run_blocking(write_partial_xlsx, job, sheets, path)
+    except BaseException:
+        if os.path.exists(path): os.remove(path)
+        raise
+
+    def stream():
+        try:
+            with open(path, "rb") as f:
+                while chunk := f.read(64 * 1024):
+                    yield chunk
+        finally:
+            os.remove(path)  # 전송이 끝나거나 연결이 끊기면 임시 파일 삭제
+    response = Response(stream(), mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(export_filename(job, extension))}",
+                                 "Content-Length": str(os.path.getsize(path))})
+    response.headers["X-Rows-Completed"] = str(rows)
+    return response
+
+@app.route("/jobs/<job_id>/results.ndjson")
+def stream_results(job_id):
+    # 완료된 행을 한 줄에 JSON 하나로 전송. 진행 중이면 작업이 끝날 때까지 새 행을 이어서 보냄 (?follow=0 이면 지금까지만)
+    # ?since=N 이면 행 번호 N 이후부터 (연결이 끊긴 뒤 이어받기)
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"message": "작업을 찾을 수 없습니다."}), 404
+    follow = request.args.get("follow", "1") != "0"
+    since = request.args.get("since", -1, type=int)
+
+    def generate():
+        sheets = job["sheets"]
+        for index, sheet_no, row in iter_job_rows(job, follow):
+            if index <= since: continue
+            if sheet_no >= len(sheets):  # 대기 중이던 작업이 시작되면서 시트 정보가 생김
+                sheets = job_store.get(job_id)["sheets"] or [["Sheet1", RESULT_HEADERS]]
+            title, header = sheets[sheet_no]
+            yield json.dumps({"index": index, "sheet": title, **dict(zip(header, row))}, ensure_ascii=False, default=str) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/jobs/<job_id>/profile")
+def download_profile(job_id):
+    path = os.path.join(RESULTS_DIR, f"{job_id}.profile.txt")
+    if not os.path.exists(path):
+        return "No profile available", 404
+    return send_file(os.path.abspath(path), mimetype="text/plain")
+
+def live_worker_stats():
+    # 큐 모드: 최근 JOB_STALE_SECONDS 안에 값을 기록한(살아 있는) 워커 프로세스들의 메트릭/키 사용량
+    return job_store.worker_stats(time.time() - JOB_STALE_SECONDS) if JOB_BACKEND == "queue" else []
+
+@app.route("/metrics")
+def metrics_endpoint():
+    workers = live_worker_stats()
+    if JOB_BACKEND == "queue":  # 대기 작업은 워커가 jobs.db에서 가져가므로 DB 기준으로 계산
+        metrics.set("pps_jobs_queued", job_store.count("queued"))
+    return Response(metrics.render([(worker, values) for worker, values, _, _ in workers]), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api_keys")
+def api_key_usage():
+    # 키별 상태/사용량 (키 값은 포함하지 않음). 큐 모드에서는 실제로 키를 쓰는 워커 프로세스들의 사용량을 합산
+    if JOB_BACKEND != "queue":
+        return jsonify({"budget_window": api_keys.budget_window, "keys": api_keys.snapshot()})
+    workers = live_worker_stats()
+    return jsonify({"budget_window": api_keys.budget_window, "keys": merge_key_usage(keys for _, _, keys, _ in workers),
+                    "workers": [{"worker": worker, "updated_at": updated_at, "keys": keys} for worker, _, keys, updated_at in workers]})
+
+@app.route("/download")
+def download_legacy():
+    job_id = request.args.get("job_id")
+    if not job_id:
+        return "job_id is required", 400
+    return download_file(job_id)
+
 @app.route('/upload_prompt', methods=['POST'])
 def upload_prompt():
     if 'prompt_file' not in request.files:
@@ -256,7 +2475,7 @@ def get_default_system_prompt():
         '  "lowest_price": 999,\n'
         '  "lowest_price_product": "Example Product 2",\n'
         '  "lowest_price_source": "Example Source 2",\n'
-        '  "lowest_price_url": "https://www.example.com/2",\n'
+        '  "lowest_price_url": "https://www.example.com/2"\n'
         "}\n"
         "```\n"
         "**END JSON ONLY INSTRUCTION**"
@@ -0,0 +1,56 @@
+# 로컬 스텁 HTTP 서버로 동시 실행 수에 따른 background_search 소요 시간 측정
+# 사용법: python bench/bench_concurrency.py [행 수] [응답 지연(초)]
+import logging
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+from openpyxl import Workbook
+import bench_env  # noqa: F401  (app import 전에 임시 작업 디렉터리 설정)
+from mock_perplexity import MockConfig, start_mock_server
+import app
+
+def make_catalog(rows):
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["상품명"])
+    for i in range(rows):
+        ws.append([f"상품 {i}"])
+    wb.save(path)
+    return path
+
+def setup_app(base_url):
+    # 벤치마크용: mock 서버 연결, 로그 큐/캐시/키별 RPM 제한 해제
+    app.API_BASE_URL = base_url
+    app.root_logger.removeHandler(app.handler)
+    app.root_logger.setLevel(logging.ERROR)
+    app.price_cache = None
+    app.api_keys = app.ApiKeyPool([app.ApiKey("bench", "bench", 0)])
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    server, base_url = start_mock_server(MockConfig(delay=delay))
+    setup_app(base_url)
+
+    print(f"rows={rows} delay={delay}s")
+    baseline = None
+    for concurrency in (1, 2, 4, 8, 16):
+        path = make_catalog(rows)
+        start = time.perf_counter()
+        job_id = app.job_store.create("bench.xlsx")
+        app.background_search(job_id, path, "bench.xlsx", app.get_default_system_prompt(), "sonar",
+                              concurrency=concurrency, rpm=0)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"concurrency={concurrency:>2}  {elapsed:6.2f}s  speedup x{baseline / elapsed:.1f}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
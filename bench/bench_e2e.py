@@ -0,0 +1,112 @@
+# 업로드 -> 검색 -> 다운로드 전체 흐름을 Flask 앱으로 실행하는 오프라인 벤치마크 (실제 API 호출 없음)
+# 행 수마다 별도 프로세스에서 실행해서 처리 속도, 최대 메모리(RSS), 전체 소요 시간을 측정
+# 사용법: python bench/bench_e2e.py --rows 100 1000 10000 --delay 0.05 --concurrency 16 [--json results.json]
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+import bench_env  # noqa: F401  (app import 전에 임시 작업 디렉터리 설정, 자식 프로세스도 상속)
+from mock_perplexity import add_mock_arguments, config_from_args, start_mock_server
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="오프라인 end-to-end 벤치마크")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--distinct", type=float, default=1.0, help="고유 상품 비율 (중복 제거 효과 측정용)")
+    parser.add_argument("--json", help="결과를 JSON으로 저장할 경로")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    add_mock_arguments(parser)
+    return parser.parse_args(argv)
+
+def make_catalog(rows, distinct):
+    from openpyxl import Workbook
+    import tempfile
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["상품명"])
+    unique = max(1, int(rows * distinct))
+    for i in range(rows):
+        ws.append([f"벤치마크 상품 {i % unique} 256GB"])
+    wb.save(path)
+    return path
+
+def run_child(args):
+    from bench_concurrency import setup_app
+    import app
+    config = config_from_args(args)
+    server, base_url = start_mock_server(config)
+    setup_app(base_url)
+    client = app.app.test_client()
+    catalog = make_catalog(args.child, args.distinct)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    with open(catalog, "rb") as f:
+        upload = client.post("/upload", data={"file": (f, "bench.xlsx")}).get_json()
+    os.remove(catalog)
+    job_id = client.post("/search", data={"file_path": upload["file_path"], "rpm": "0",
+                                          "concurrency": str(args.concurrency), "batch_size": str(args.batch_size)}).get_json()["job_id"]
+    while True:
+        job = client.get(f"/jobs/{job_id}").get_json()
+        if job["status"] in ("done", "failed"): break
+        time.sleep(0.05)
+    download = client.get(f"/jobs/{job_id}/download")
+    result_bytes = len(download.data)
+    elapsed = time.perf_counter() - start
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stats = job["stats"]
+    if job["result_path"]: os.remove(job["result_path"])
+    server.shutdown()
+    print(json.dumps({
+        "rows": args.child, "status": job["status"], "elapsed": round(elapsed, 2),
+        "rows_per_sec": round(args.child / elapsed, 1), "api_requests": config.requests,
+        "peak_rss_mb": round(peak_rss / 1024, 1), "rss_growth_mb": round((peak_rss - baseline_rss) / 1024, 1),
+        "latency_p50": stats.get("latency_p50"), "latency_p95": stats.get("latency_p95"),
+        "success": stats.get("success"), "empty": stats.get("empty"), "errors": stats.get("errors"),
+        "result_bytes": result_bytes,
+    }))
+
+def main():
+    args = parse_args()
+    if args.child:
+        return run_child(args)
+    results = []
+    print(f"{'rows':>7} {'status':>6} {'elapsed':>8} {'rows/s':>8} {'requests':>8} {'peak_rss':>9} {'p50':>6} {'p95':>6} {'errors':>6}")
+    for rows in args.rows:
+        # --rows 값은 자식 프로세스에 넘기지 않고 --child로 대체
+        argv = list(_strip_rows(sys.argv[1:]))
+        output = subprocess.run([sys.executable, __file__, *argv, "--child", str(rows)],
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{result['rows']:>7} {result['status']:>6} {result['elapsed']:>7.2f}s {result['rows_per_sec']:>8.1f} "
+              f"{result['api_requests']:>8} {result['peak_rss_mb']:>7.1f}MB {result['latency_p50'] or 0:>6.3f} "
+              f"{result['latency_p95'] or 0:>6.3f} {result['errors']:>6}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k not in ("child", "json")}, "results": results}, f, indent=2)
+
+def _strip_rows(argv):
+    skipping = False
+    for arg in argv:
+        if arg == "--rows":
+            skipping = True
+            continue
+        if skipping and not arg.startswith("--"):
+            continue
+        skipping = False
+        yield arg
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+# 벤치마크 공통: app을 불러오기 전에 작업 DB/가격 캐시/체크포인트/결과/업로드 경로를 임시 디렉터리로 돌림
+# (벤치 작업이 실제 ./data/jobs.db, ./cache 에 쌓이지 않도록). 이미 지정된 환경 변수는 그대로 사용 -> 자식 프로세스도 같은 디렉터리 공유
+import os
+import tempfile
+
+WORKDIR = os.environ.get("BENCH_WORKDIR") or tempfile.mkdtemp(prefix="pps-bench-")
+os.environ["BENCH_WORKDIR"] = WORKDIR
+for name, path in (("JOBS_DB_PATH", "jobs.db"), ("PRICE_CACHE_PATH", "price_cache.db"), ("CHECKPOINT_DIR", "checkpoints"),
+                   ("RESULTS_DIR", "results"), ("UPLOAD_DIR", "uploads")):
+    os.environ.setdefault(name, os.path.join(WORKDIR, path))
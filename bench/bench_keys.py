@@ -0,0 +1,67 @@
+# API 키 수에 따른 처리량 측정 (mock Perplexity API가 키별 분당 요청 한도를 적용, 실제 API 호출 없음)
+# 키마다 같은 분당요청수를 주고 키 1/2/4개로 같은 작업을 돌려 행/초와 키별 사용량, 429/401 건수를 비교
+# --invalid 로 무효 키(401)를 섞으면 키 풀에서 빠지고 나머지 키로 계속 진행하는지 확인
+# 사용법: python bench/bench_keys.py --keys 1 2 4 --key-rpm 600 --rows 300 --delay 0.05 [--invalid 1]
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+from bench_concurrency import setup_app
+from bench_e2e import make_catalog
+from mock_perplexity import add_mock_arguments, config_from_args, start_mock_server
+import app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="API 키 수별 처리량 벤치마크")
+    parser.add_argument("--keys", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--invalid", type=int, default=0, help="함께 넣을 무효 키(401) 수")
+    parser.add_argument("--rows", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--json", help="결과를 JSON으로 저장할 경로")
+    add_mock_arguments(parser)
+    parser.set_defaults(key_rpm=600.0)
+    return parser.parse_args(argv)
+
+def run(count, args, config):
+    spec = ",".join([f"k{n}=bench-{n}" for n in range(count)] + [f"bad{n}=invalid-{n}" for n in range(args.invalid)])
+    config.invalid_keys = {f"invalid-{n}" for n in range(args.invalid)}
+    app.api_keys = app.ApiKeyPool(app.parse_api_keys(spec, args.key_rpm))
+    path = make_catalog(args.rows, 1.0)
+    job_id = app.job_store.create("bench.xlsx")
+    started = time.perf_counter()
+    app.background_search(job_id, path, "bench.xlsx", app.get_default_system_prompt(), "sonar",
+                          concurrency=args.concurrency, rpm=0)
+    elapsed = time.perf_counter() - started
+    job = app.job_store.get(job_id)
+    usage = app.api_keys.snapshot()
+    return {"keys": count, "invalid": args.invalid, "status": job["status"], "elapsed": round(elapsed, 2),
+            "rows_per_sec": round(args.rows / elapsed, 1),
+            "requests": {key["name"]: key["requests"] for key in usage},
+            "rejected": {key["name"]: key["statuses"].get("429", 0) + key["statuses"].get("401", 0) for key in usage}}
+
+def main():
+    args = parse_args()
+    config = config_from_args(args)
+    server, base_url = start_mock_server(config)
+    setup_app(base_url)
+    results = []
+    try:
+        for count in args.keys:
+            result = run(count, args, config)
+            results.append(result)
+            print(f"keys={count:>2}  {result['elapsed']:6.2f}s  {result['rows_per_sec']:7.1f} 행/초  "
+                  f"x{result['rows_per_sec'] / results[0]['rows_per_sec']:.1f}  ({result['status']})  "
+                  f"키별 요청 {result['requests']}  거부(429/401) {result['rejected']}", flush=True)
+    finally:
+        server.shutdown()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
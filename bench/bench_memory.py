@@ -0,0 +1,42 @@
+# 행 수에 따른 background_search 최대 메모리(RSS) 측정
+# 행 수마다 별도 프로세스로 실행 (ru_maxrss는 프로세스 단위 최댓값)
+# 사용법: python bench/bench_memory.py [행 수 ...]
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+import bench_env  # noqa: F401  (app import 전에 임시 작업 디렉터리 설정, 자식 프로세스도 상속)
+
+def run_child(rows):
+    import bench_concurrency
+    from mock_perplexity import start_mock_server
+    import app
+    server, base_url = start_mock_server()
+    bench_concurrency.setup_app(base_url)
+
+    path = bench_concurrency.make_catalog(rows)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    job_id = app.job_store.create("bench.xlsx")
+    app.background_search(job_id, path, "bench.xlsx", app.get_default_system_prompt(), "sonar",
+                          concurrency=8, rpm=0)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    os.remove(app.job_store.get(job_id)["result_path"])
+    print(f"rows={rows:>7}  peak_rss={peak / 1024:7.1f}MB  (+{(peak - baseline) / 1024:6.1f}MB)  {elapsed:6.1f}s  {rows / elapsed:7.0f} rows/s")
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000]
+    for rows in sizes:
+        subprocess.run([sys.executable, __file__, "--child", str(rows)], check=True)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        run_child(int(sys.argv[2]))
+    else:
+        main()
@@ -0,0 +1,68 @@
+# 응답 파서 정확도/속도 비교: 기존 파서(clean_json_response + json.loads + 기존 process_price) vs extract_json
+# 코퍼스: bench/parser_corpus.jsonl ({"name", "response", "expected": {"highest_price", "lowest_price"} | null})
+# 사용법: python bench/bench_parser.py [반복 횟수]
+import json
+import os
+import re
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+import bench_env  # noqa: F401  (app import 전에 임시 작업 디렉터리 설정)
+import app
+
+def legacy_process_price(price_str):
+    # 개선 전 process_price (비교용)
+    if price_str is None: return None
+    if isinstance(price_str, (int, float)): return price_str
+    price_str = re.sub(r"[^0-9,]", "", price_str)
+    try:
+        price_int = int(price_str.replace(",", ""))
+        if "VAT 별도" in price_str.lower() or "(별도)" in price_str.lower():
+            price_int = int(price_int * 1.1)
+        return price_int
+    except ValueError: return None
+
+def legacy_parse(response):
+    try:
+        content = json.loads(app.clean_json_response(response))
+    except json.JSONDecodeError:
+        return None
+    return {"highest_price": legacy_process_price(content.get("highest_price")),
+            "lowest_price": legacy_process_price(content.get("lowest_price"))}
+
+def current_parse(response):
+    content = app.extract_json(response)
+    if content is None: return None
+    return {"highest_price": app.process_price(content.get("highest_price")),
+            "lowest_price": app.process_price(content.get("lowest_price"))}
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(os.path.join(BENCH_DIR, "parser_corpus.jsonl"), encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    failures = []
+    for name, parse in (("legacy", legacy_parse), ("current", current_parse)):
+        correct = 0
+        for case in corpus:
+            try: actual = parse(case["response"])
+            except Exception as e: actual = f"{type(e).__name__}: {e}"
+            if actual == case["expected"]: correct += 1
+            elif name == "current": failures.append((case["name"], case["expected"], actual))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for case in corpus:
+                try: parse(case["response"])
+                except Exception: pass
+        per_parse = (time.perf_counter() - start) / (repeat * len(corpus)) * 1e6
+        print(f"{name:<8} correct {correct:>2}/{len(corpus)}  {per_parse:7.1f} us/parse")
+
+    for case_name, expected, actual in failures:
+        print(f"FAIL {case_name}: expected {expected}, got {actual}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# mock 서버에 지연/오류/429/장애를 주입해서 재시도, Retry-After, 서킷 브레이커 동작 확인
+# 사용법: python bench/bench_resilience.py [행 수]
+import os
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+from openpyxl import load_workbook
+from bench_concurrency import make_catalog, setup_app
+from mock_perplexity import MockConfig, start_mock_server
+import app
+
+def run(name, config, rows, on_start=None):
+    server, base_url = start_mock_server(config)
+    setup_app(base_url)
+    # 벤치마크 시간을 줄이기 위해 백오프/차단 시간 단축
+    app.API_BACKOFF_BASE, app.API_BACKOFF_MAX = 0.05, 0.5
+    app.circuit_breaker = app.CircuitBreaker(failure_threshold=5, reset_seconds=0.5, max_pause=30)
+
+    path = make_catalog(rows)
+    job_id = app.job_store.create("bench.xlsx")
+    if on_start: on_start()
+    start = time.perf_counter()
+    app.background_search(job_id, path, "bench.xlsx", app.get_default_system_prompt(), "sonar", concurrency=8, rpm=0)
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    job = app.job_store.get(job_id)
+    empty = 0
+    if job["result_path"]:
+        wb = load_workbook(job["result_path"], read_only=True)
+        empty = sum(1 for row in wb.worksheets[0].iter_rows(min_row=2, max_col=9, values_only=True)
+                    if row[1] is None and row[5] is None)
+        wb.close()
+        os.remove(job["result_path"])
+    print(f"{name:<22} status={job['status']:<6} rows={rows}  empty={empty:<4} requests={config.requests:<5} {elapsed:6.2f}s")
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    run("healthy", MockConfig(delay=0.02), rows)
+    run("30% 503", MockConfig(delay=0.02, error_rate=0.3), rows)
+    run("20% 429 Retry-After", MockConfig(delay=0.02, rate_limit_rate=0.2, retry_after=0.2), rows)
+
+    # 2초간 전체 장애 후 복구: 서킷 브레이커가 작업을 멈췄다가 재개해야 빈 결과가 생기지 않음
+    outage = MockConfig(delay=0.02, error_rate=1.0)
+    def recover_later():
+        threading.Timer(2.0, lambda: setattr(outage, "error_rate", 0.0)).start()
+    run("2s outage", outage, rows, on_start=recover_later)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# 작업 간 우선순위/공정 분배 측정 (mock Perplexity API 사용, 실제 API 호출 없음)
+# 큰 작업이 API 동시 호출 슬롯을 채우고 있을 때 작은 급한 작업의 완료 시간을 우선순위별로 비교하고,
+# 큰 작업이 작업 자리(MAX_CONCURRENT_JOBS)까지 모두 채운 상태에서 급한 작업이 바로 시작되는지,
+# 취소 후 새로 나간 API 요청 수와 취소 반영까지 걸린 시간을 측정
+# 사용법: python bench/bench_scheduling.py --big 400 --small 80 --slots 8 --jobs 4 --priorities 1 3 9 --delay 0.2
+#         (--no-preempt: 자리가 날 때까지 기다리는 이전 동작과 비교)
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="작업 우선순위/공정 분배 벤치마크")
+    parser.add_argument("--big", type=int, default=400, help="먼저 시작하는 큰 작업의 행 수 (우선순위 1)")
+    parser.add_argument("--small", type=int, default=80, help="나중에 들어오는 급한 작업의 행 수")
+    parser.add_argument("--slots", type=int, default=8, help="MAX_CONCURRENT_API_CALLS")
+    parser.add_argument("--jobs", type=int, default=4, help="MAX_CONCURRENT_JOBS (이만큼 큰 작업으로 작업 자리를 채움)")
+    parser.add_argument("--urgent", type=int, default=10, help="작업 자리가 찼을 때 제출하는 급한 작업의 우선순위")
+    parser.add_argument("--no-preempt", action="store_true", help="JOB_PRIORITY_PREEMPT=0 (자리가 날 때까지 대기)")
+    parser.add_argument("--priorities", type=int, nargs="+", default=[1, 3, 9])
+    parser.add_argument("--concurrency", type=int, default=16, help="작업당 동시 API 호출 수")
+    parser.add_argument("--json", help="결과를 JSON으로 저장할 경로")
+    from mock_perplexity import add_mock_arguments
+    add_mock_arguments(parser)
+    parser.set_defaults(delay=0.2)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    os.environ.update(MAX_CONCURRENT_API_CALLS=str(args.slots), MAX_CONCURRENT_JOBS=str(args.jobs),  # app import 전에 설정
+                      JOB_PRIORITY_PREEMPT="0" if args.no_preempt else "1")
+    from bench_concurrency import make_catalog, setup_app
+    from mock_perplexity import config_from_args, start_mock_server
+    import app
+
+    config = config_from_args(args)
+    server, base_url = start_mock_server(config)
+    setup_app(base_url)
+
+    def submit(rows, priority):
+        job_id = app.job_store.create("bench.xlsx", {"file_path": make_catalog(rows), "output_filename": "bench.xlsx",
+            "system_prompt": app.get_default_system_prompt(), "model": "sonar", "concurrency": args.concurrency,
+            "rpm": 0, "priority": priority})
+        app.submit_job(job_id)
+        return job_id
+
+    def wait(job_id, statuses=("done", "failed", "cancelled")):
+        while app.job_store.get(job_id)["status"] not in statuses: time.sleep(0.02)
+
+    def status(job_id):
+        return app.job_store.get(job_id)["status"]
+
+    results = {"small_alone": None, "small_behind_big": {}}
+    try:
+        started = time.perf_counter()
+        wait(submit(args.small, 1))
+        results["small_alone"] = round(time.perf_counter() - started, 2)
+        print(f"급한 작업 단독            {results['small_alone']:6.2f}s", flush=True)
+        for priority in args.priorities:
+            big = submit(args.big, 1)
+            while app.job_store.get(big)["completed"] < args.slots: time.sleep(0.02)  # 큰 작업이 슬롯을 채운 뒤 제출
+            started = time.perf_counter()
+            wait(submit(args.small, priority))
+            elapsed = results["small_behind_big"][priority] = round(time.perf_counter() - started, 2)
+            print(f"큰 작업 실행 중, 우선순위 {priority:>2}  {elapsed:6.2f}s  (단독 대비 x{elapsed / results['small_alone']:.2f})", flush=True)
+            wait(big)
+
+        # 작업 자리가 모두 찬 상태: 큰 작업 --jobs개 실행 중에 급한 작업 제출 -> 큰 작업이 끝나기 전에 시작/완료되는지
+        bigs = [submit(args.big, 1) for _ in range(args.jobs)]
+        while any(status(big) != "running" for big in bigs): time.sleep(0.02)
+        while app.api_scheduler.in_use < args.slots: time.sleep(0.02)
+        started = time.perf_counter()
+        urgent = submit(args.small, args.urgent)
+        wait(urgent, ("running", "done", "failed", "cancelled"))
+        start_delay = time.perf_counter() - started
+        wait(urgent)
+        elapsed = time.perf_counter() - started
+        results["slots_full"] = {"jobs": args.jobs, "priority": args.urgent, "preempt": not args.no_preempt,
+                                 "start_seconds": round(start_delay, 2), "seconds": round(elapsed, 2),
+                                 "big_done_before": sum(status(big) == "done" for big in bigs)}
+        print(f"작업 자리 {args.jobs}개 가득, 우선순위 {args.urgent:>2}  {elapsed:6.2f}s  (시작까지 {start_delay:.2f}s, "
+              f"그 사이 끝난 큰 작업 {results['slots_full']['big_done_before']}개)", flush=True)
+
+        # 취소: 요청 직후부터 새로 전송된 API 요청 수 (이미 전송 중이던 요청은 제외). 위의 큰 작업들을 모두 취소
+        inflight = app.api_scheduler.in_use
+        sent = config.requests
+        started = time.perf_counter()
+        client = app.app.test_client()
+        for big in bigs: client.post(f"/jobs/{big}/cancel")
+        for big in bigs: wait(big)  # 취소 전에 끝난 작업은 done
+        while app.api_scheduler.in_use: time.sleep(0.02)  # 취소 시점에 전송 중이던 요청의 응답까지
+        results["cancel"] = {"seconds": round(time.perf_counter() - started, 3), "requests_after": config.requests - sent,
+                             "inflight_at_cancel": inflight, "cancelled": sum(status(big) == "cancelled" for big in bigs)}
+        print(f"취소 반영 {results['cancel']['seconds']}s, 취소 후 수신된 요청 {results['cancel']['requests_after']}건 "
+              f"(취소 시점 전송 중 {inflight}건, 취소된 작업 {results['cancel']['cancelled']}/{len(bigs)}개)", flush=True)
+    finally:
+        server.shutdown()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
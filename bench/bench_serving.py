@@ -0,0 +1,142 @@
+# gunicorn 워커 종류별 부하 테스트: /logs SSE 구독 다수 + 검색 작업 여러 개를 실제 gunicorn 프로세스에 동시에 걸고
+# 구독 연결 성공 수, 작업 완료 시간, 부하 중 /jobs/<id> 응답 지연을 측정 (mock Perplexity API 사용, 실제 API 호출 없음)
+# 사용법: python bench/bench_serving.py --worker-class gevent gthread sync --jobs 8 --rows 200 --watchers 200 --delay 0.2
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, BENCH_DIR)
+import requests
+from bench_e2e import make_catalog
+from mock_perplexity import add_mock_arguments, config_from_args, start_mock_server
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="gunicorn 서빙 모드 부하 테스트")
+    parser.add_argument("--worker-class", nargs="+", default=["gevent", "gthread", "sync"])
+    parser.add_argument("--jobs", type=int, default=8, help="동시에 제출할 검색 작업 수")
+    parser.add_argument("--rows", type=int, default=200, help="작업당 행 수")
+    parser.add_argument("--watchers", type=int, default=200, help="동시에 열어 둘 /logs SSE 연결 수")
+    parser.add_argument("--concurrency", type=int, default=8, help="작업당 동시 API 호출 수")
+    parser.add_argument("--deadline", type=float, default=120, help="워커 종류별 최대 측정 시간(초)")
+    parser.add_argument("--json", help="결과를 JSON으로 저장할 경로")
+    add_mock_arguments(parser)
+    parser.set_defaults(delay=0.2)
+    return parser.parse_args(argv)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_gunicorn(worker_class, base_url, workdir):
+    port = free_port()
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, WEB_CONCURRENCY="1", PERPLEXITY_API_BASE=base_url,
+               PERPLEXITY_API_KEY="bench", PERPLEXITY_RPM="0", PRICE_CACHE_TTL="0", MAX_CONCURRENT_JOBS="64",
+               MAX_CONCURRENT_API_CALLS="256", JOBS_DB_PATH=os.path.join(workdir, "jobs.db"),
+               RESULTS_DIR=os.path.join(workdir, "results"), CHECKPOINT_DIR=os.path.join(workdir, "checkpoints"),
+               UPLOAD_DIR=os.path.join(workdir, "uploads"))
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:app", "-c", "gunicorn.conf.py",
+                                "-b", f"127.0.0.1:{port}", "--log-level", "warning"],
+                               cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(f"{url}/jobs", timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"gunicorn({worker_class}) 시작 실패")
+
+def watch(url, job_id, connected, stop):
+    # 응답 헤더를 받으면 연결 성공으로 보고, 종료 신호까지 스트림을 열어 둠
+    try:
+        with requests.get(f"{url}/logs", params={"job_id": job_id}, stream=True, timeout=(5, 30)) as response:
+            connected.append(response.status_code == 200)
+            for _ in response.iter_content(chunk_size=None):
+                if stop.is_set(): break
+    except requests.RequestException:
+        pass
+
+def run(worker_class, args, base_url, catalog):
+    workdir = tempfile.mkdtemp()
+    process, url = start_gunicorn(worker_class, base_url, workdir)
+    stop = threading.Event()
+    connected = []
+    result = {"worker_class": worker_class, "watchers": args.watchers, "jobs": args.jobs, "rows": args.rows}
+    try:
+        started = time.perf_counter()
+        job_ids = []
+        try:
+            for _ in range(args.jobs):
+                with open(catalog, "rb") as f:
+                    upload = requests.post(f"{url}/upload", files={"file": ("bench.xlsx", f)}, timeout=10).json()
+                job_ids.append(requests.post(f"{url}/search", timeout=10, data={
+                    "file_path": upload["file_path"], "rpm": "0", "concurrency": str(args.concurrency)}).json()["job_id"])
+        except requests.RequestException as e:
+            result["submit_error"] = type(e).__name__
+        # 브라우저처럼 구독자마다 작업 하나의 로그/진행 상황을 구독 (작업당 watchers/jobs 명)
+        for i in range(args.watchers):
+            job_id = job_ids[i % len(job_ids)] if job_ids else None
+            threading.Thread(target=watch, args=(url, job_id, connected, stop), daemon=True).start()
+
+        latencies, done = [], set()
+        while job_ids and len(done) < len(job_ids) and time.perf_counter() - started < args.deadline:
+            for job_id in job_ids:
+                if job_id in done: continue
+                t = time.perf_counter()
+                try:
+                    job = requests.get(f"{url}/jobs/{job_id}", timeout=10).json()
+                except requests.RequestException:
+                    continue
+                latencies.append(time.perf_counter() - t)
+                if job["status"] in ("done", "failed"): done.add(job_id)
+            time.sleep(0.2)
+        latencies.sort()
+        result.update({
+            "watchers_connected": len(connected),
+            "jobs_finished": len(done), "elapsed": round(time.perf_counter() - started, 2),
+            "rows_per_sec": round(len(done) * args.rows / (time.perf_counter() - started), 1),
+            "status_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+            "status_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1) if latencies else None,
+        })
+    finally:
+        stop.set()
+        process.send_signal(signal.SIGINT)  # 빠른 종료 (열린 SSE 연결을 기다리지 않음)
+        try: process.wait(timeout=10)
+        except subprocess.TimeoutExpired: process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+def main():
+    args = parse_args()
+    config = config_from_args(args)
+    server, base_url = start_mock_server(config)
+    catalog = make_catalog(args.rows, 1.0)
+    results = []
+    try:
+        for worker_class in args.worker_class:
+            result = run(worker_class, args, base_url, catalog)
+            results.append(result)
+            print(f"{worker_class:>8}: SSE {result['watchers_connected']}/{args.watchers} 연결, "
+                  f"작업 {result['jobs_finished']}/{args.jobs} 완료 {result['elapsed']}s ({result['rows_per_sec']} 행/초), "
+                  f"/jobs 지연 p50 {result['status_p50_ms']}ms / p95 {result['status_p95_ms']}ms", flush=True)
+    finally:
+        os.remove(catalog)
+        server.shutdown()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# 웹 프로세스 시작 비용 측정: app import 시간, import 직후/첫 요청 후 RSS, 불러온 무거운 모듈
+# --compare 로 지정한 git 리비전의 app.py와 나란히 비교 (예: 지연 import 적용 전후)
+# 사용법: python bench/bench_startup.py [--compare HEAD~1] [--repeat 5] [--json results.json]
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BENCH_DIR, ".."))
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "requests", "xlrd")
+
+CHILD = """
+import json, sys, time
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"): return int(line.split()[1]) / 1024
+baseline = rss_mb()
+started = time.perf_counter()
+import app
+import_seconds = time.perf_counter() - started
+after_import = rss_mb()
+client = app.app.test_client()
+for path in ("/", "/jobs", "/metrics"):
+    client.get(path)
+print(json.dumps({"import_ms": import_seconds * 1000, "rss_baseline_mb": baseline, "rss_import_mb": after_import,
+                  "rss_first_requests_mb": rss_mb(), "loaded": [m for m in sys.argv[1:] if m in sys.modules]}))
+"""
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="웹 프로세스 시작 시간/메모리 벤치마크")
+    parser.add_argument("--compare", help="비교할 git 리비전 (예: HEAD~1)")
+    parser.add_argument("--repeat", type=int, default=5, help="리비전별 측정 횟수 (중앙값 사용)")
+    parser.add_argument("--json", help="결과를 JSON으로 저장할 경로")
+    return parser.parse_args(argv)
+
+def export_revision(revision):
+    # 지정 리비전의 app.py/templates만 임시 디렉터리로 꺼냄
+    target = tempfile.mkdtemp()
+    archive = subprocess.run(["git", "archive", revision, "app.py", "templates"], cwd=ROOT_DIR, check=True, capture_output=True).stdout
+    subprocess.run(["tar", "-x", "-C", target], input=archive, check=True)
+    return target
+
+def measure(source_dir, repeat):
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ, JOBS_DB_PATH=os.path.join(workdir, "jobs.db"), PRICE_CACHE_PATH=os.path.join(workdir, "cache.db"),
+               RESULTS_DIR=os.path.join(workdir, "results"), CHECKPOINT_DIR=os.path.join(workdir, "checkpoints"),
+               UPLOAD_DIR=os.path.join(workdir, "uploads"), PYTHONDONTWRITEBYTECODE="1")
+    runs = []
+    try:
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, "-c", CHILD, *HEAVY_MODULES], cwd=source_dir, env=env,
+                                    check=True, capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+        "rss_import_mb": round(statistics.median(r["rss_import_mb"] for r in runs), 1),
+        "rss_first_requests_mb": round(statistics.median(r["rss_first_requests_mb"] for r in runs), 1),
+        "loaded": runs[-1]["loaded"],
+    }
+
+def main():
+    args = parse_args()
+    targets = [("working tree", ROOT_DIR)]
+    exported = None
+    if args.compare:
+        exported = export_revision(args.compare)
+        targets.insert(0, (args.compare, exported))
+    results = {}
+    try:
+        for label, source_dir in targets:
+            result = results[label] = measure(source_dir, args.repeat)
+            print(f"{label:>14}: import {result['import_ms']:7.1f}ms  RSS import 후 {result['rss_import_mb']:6.1f}MB  "
+                  f"첫 요청 후 {result['rss_first_requests_mb']:6.1f}MB  불러온 모듈 {', '.join(result['loaded']) or '-'}", flush=True)
+    finally:
+        if exported: shutil.rmtree(exported, ignore_errors=True)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# 워커 프로세스 수에 따른 처리량 측정 (JOB_BACKEND=queue, mock Perplexity API 사용, 실제 API 호출 없음)
+# 작업 여러 개를 jobs.db에 넣고 worker.py --processes N 으로 모두 끝날 때까지 걸린 시간을 측정
+# 사용법: python bench/bench_workers.py --processes 1 2 4 --jobs 8 --rows 500 --delay 0
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+from mock_perplexity import add_mock_arguments, config_from_args, start_mock_server
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="워커 프로세스 수별 처리량 벤치마크")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=500, help="작업당 행 수")
+    parser.add_argument("--concurrency", type=int, default=16, help="작업당 동시 API 호출 수")
+    parser.add_argument("--json", help="결과를 JSON으로 저장할 경로")
+    add_mock_arguments(parser)
+    parser.set_defaults(delay=0.0)
+    return parser.parse_args(argv)
+
+def run(processes, args, base_url):
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ, JOB_BACKEND="queue", PERPLEXITY_API_BASE=base_url, PERPLEXITY_API_KEY="bench",
+               PERPLEXITY_RPM="0", PRICE_CACHE_TTL="0", MAX_CONCURRENT_API_CALLS="256",
+               JOBS_DB_PATH=os.path.join(workdir, "jobs.db"), RESULTS_DIR=os.path.join(workdir, "results"),
+               CHECKPOINT_DIR=os.path.join(workdir, "checkpoints"), UPLOAD_DIR=os.path.join(workdir, "uploads"))
+    # 웹 프로세스 역할: 작업을 큐에 넣기만 함 (작업마다 내용이 다른 파일 -> 체크포인트/업로드 공유 없음)
+    enqueue = (
+        "import os, sys, app\n"
+        "from openpyxl import Workbook\n"
+        "os.makedirs(app.UPLOAD_DIR, exist_ok=True)\n"
+        "for j in range(int(sys.argv[1])):\n"
+        "    path = os.path.join(app.UPLOAD_DIR, f'job{j}.xlsx')\n"
+        "    wb = Workbook(write_only=True); ws = wb.create_sheet(); ws.append(['상품명'])\n"
+        "    for i in range(int(sys.argv[2])): ws.append([f'작업{j} 상품 {i}'])\n"
+        "    wb.save(path)\n"
+        "    job_id = app.job_store.create('bench.xlsx', {'file_path': path, 'output_filename': 'bench.xlsx',\n"
+        "        'system_prompt': app.get_default_system_prompt(), 'model': 'sonar', 'concurrency': int(sys.argv[3]), 'rpm': 0})\n"
+        "    app.submit_job(job_id)\n"
+    )
+    subprocess.run([sys.executable, "-c", enqueue, str(args.jobs), str(args.rows), str(args.concurrency)],
+                   cwd=ROOT_DIR, env=env, check=True)
+
+    import sqlite3
+    conn = sqlite3.connect(env["JOBS_DB_PATH"], timeout=30)
+    started = time.perf_counter()
+    worker = subprocess.Popen([sys.executable, "worker.py", "--processes", str(processes)], cwd=ROOT_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            pending, failed = conn.execute("SELECT SUM(status NOT IN ('done', 'failed')), SUM(status = 'failed') FROM jobs").fetchone()
+            if not pending: break
+            time.sleep(0.1)
+        elapsed = time.perf_counter() - started
+    finally:
+        worker.terminate()
+        worker.wait()
+        conn.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    rows = args.jobs * args.rows
+    return {"processes": processes, "jobs": args.jobs, "rows": rows, "failed": failed or 0,
+            "elapsed": round(elapsed, 2), "rows_per_sec": round(rows / elapsed, 1)}
+
+def main():
+    args = parse_args()
+    config = config_from_args(args)
+    server, base_url = start_mock_server(config)
+    results = []
+    try:
+        for processes in args.processes:
+            result = run(processes, args, base_url)
+            results.append(result)
+            speedup = results[0]["elapsed"] / result["elapsed"]
+            print(f"processes={processes:>2}  {result['elapsed']:6.2f}s  {result['rows_per_sec']:7.1f} 행/초  "
+                  f"x{speedup:.1f}  (실패 {result['failed']}건)", flush=True)
+    finally:
+        server.shutdown()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# 로컬 Perplexity API 대역 서버 (/chat/completions)
+# 응답 지연 분포, 5xx 오류, 429(Retry-After), 잘못된 JSON 응답 비율, API 키별 분당 요청 한도/무효 키를 설정해서 벤치마크/장애 재현에 사용
+# 단독 실행: python bench/mock_perplexity.py --port 8099 --delay 0.5 --latency lognormal --jitter 0.6
+#           PERPLEXITY_API_BASE=http://127.0.0.1:8099 gunicorn app:app
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MALFORMED_RESPONSES = (
+    '{"highest_price": "1,000원", "lowest_price": ',  # 잘린 응답
+    '가격 정보를 찾을 수 없습니다.',  # JSON 없이 설명만
+    '{"highest_price": 1000, "lowest_price": 900,}',  # trailing comma
+)
+
+class MockConfig:
+    def __init__(self, delay=0.0, jitter=0.0, latency="uniform", error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=None, malformed_rate=0.0, null_rate=0.0, strong_models=("sonar-pro",), key_rpm=0.0,
+                 invalid_keys=()):
+        self.delay = delay  # 기본 응답 지연(초), lognormal이면 중앙값
+        self.jitter = jitter  # uniform: 0~jitter 초 추가, lognormal: 분포의 sigma
+        self.latency = latency  # "uniform" | "lognormal"
+        self.error_rate = error_rate  # 503 응답 비율
+        self.rate_limit_rate = rate_limit_rate  # 429 응답 비율
+        self.retry_after = retry_after  # 429 응답의 Retry-After 헤더 값
+        self.malformed_rate = malformed_rate  # 200 응답 중 JSON 형식이 깨진 content 비율
+        self.null_rate = null_rate  # 가격을 찾지 못했다고(null) 답하는 비율 (strong_models에는 적용 안 함)
+        self.strong_models = set(strong_models)
+        self.key_rpm = key_rpm  # 키별 분당 요청 한도 (초과 시 429, 0 = 무제한)
+        self.invalid_keys = set(invalid_keys)  # 401을 돌려줄 키
+        self.key_buckets = {}  # 키 -> [남은 토큰, 마지막 갱신 시각]
+        self.requests_by_model = {}
+        self.requests_by_key = {}
+        self.requests = 0
+        self.log = None  # 리스트를 넣으면 요청마다 (수신 시각, 상태 코드, 마지막 메시지) 기록 (재시도 간격 검증용)
+        self.lock = threading.Lock()
+
+    def sample_delay(self):
+        if self.latency == "lognormal" and self.delay > 0:
+            return random.lognormvariate(0, self.jitter) * self.delay
+        return self.delay + random.uniform(0, self.jitter)
+
+    def take_key_token(self, key):
+        # 키별 토큰 버킷. 한도 초과면 다음 토큰까지 남은 시간(초), 아니면 None
+        if not self.key_rpm: return None
+        rate = self.key_rpm / 60.0
+        capacity = max(1.0, rate) + 1  # 클라이언트 버킷과 같은 크기 + 시계 오차 여유 1건
+        with self.lock:
+            tokens, last = self.key_buckets.get(key, (capacity, time.monotonic()))
+            now = time.monotonic()
+            tokens = min(capacity, tokens + (now - last) * rate)
+            if tokens < 1:
+                self.key_buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            self.key_buckets[key] = (tokens - 1, now)
+        return None
+
+class MockPerplexityHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # keep-alive 연결에서 헤더/본문 분리 전송 시 지연(ACK 대기) 방지
+    config = MockConfig()
+
+    def do_POST(self):
+        self.received = time.monotonic()
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.message = payload.get("messages", [{}])[-1].get("content", "")
+        config = self.config
+        model = payload.get("model")
+        key = self.headers.get("Authorization", "").removeprefix("Bearer ")
+        with config.lock:
+            config.requests += 1
+            config.requests_by_model[model] = config.requests_by_model.get(model, 0) + 1
+            config.requests_by_key[key] = config.requests_by_key.get(key, 0) + 1
+        if key in config.invalid_keys:
+            return self._send(401, {"error": "invalid api key"})
+        wait = config.take_key_token(key)
+        if wait is not None:
+            return self._send(429, {"error": "rate limited"}, {"Retry-After": f"{wait:.3f}"})
+        time.sleep(config.sample_delay())
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            headers = {"Retry-After": str(config.retry_after)} if config.retry_after is not None else {}
+            return self._send(429, {"error": "rate limited"}, headers)
+        if roll < config.rate_limit_rate + config.error_rate:
+            return self._send(503, {"error": "unavailable"})
+        user_message = payload.get("messages", [{}])[-1].get("content", "")
+        if random.random() < config.malformed_rate:
+            content = random.choice(MALFORMED_RESPONSES)
+        elif model not in config.strong_models and random.random() < config.null_rate:
+            content = json.dumps({"highest_price": None, "lowest_price": None})
+        elif "Products: " in user_message:  # 배치 요청
+            products = json.loads(user_message.split("Products: ", 1)[1])
+            content = json.dumps([dict(self._price(), product=name) for name in products], ensure_ascii=False)
+        else:
+            content = json.dumps(self._price(), ensure_ascii=False)
+        self._send(200, {"choices": [{"message": {"content": content}}]})
+
+    def _price(self):
+        return {"highest_price": "1,000원", "highest_price_product": "mock", "highest_price_source": "mock",
+                "highest_price_url": "https://example.com/high", "lowest_price": "900원",
+                "lowest_price_product": "mock", "lowest_price_source": "mock", "lowest_price_url": "https://example.com/low"}
+
+    def _send(self, status, body, headers=None):
+        if self.config.log is not None:
+            with self.config.lock:
+                self.config.log.append((self.received, status, self.message))
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def start_mock_server(config=None, port=0):
+    # (server, base_url) 반환. 종료는 server.shutdown()
+    handler = type("Handler", (MockPerplexityHandler,), {"config": config or MockConfig()})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def add_mock_arguments(parser):
+    parser.add_argument("--delay", type=float, default=0.05, help="응답 지연(초), lognormal이면 중앙값")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform: 추가 지연 최댓값, lognormal: sigma")
+    parser.add_argument("--latency", choices=("uniform", "lognormal"), default="uniform")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--null-rate", type=float, default=0.0, help="1차(sonar) 모델이 가격을 못 찾는 비율")
+    parser.add_argument("--key-rpm", type=float, default=0.0, help="API 키별 분당 요청 한도 (초과 시 429, 0 = 무제한)")
+
+def config_from_args(args):
+    return MockConfig(delay=args.delay, jitter=args.jitter, latency=args.latency, error_rate=args.error_rate,
+                      rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, malformed_rate=args.malformed_rate,
+                      null_rate=args.null_rate, key_rpm=args.key_rpm)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="로컬 Perplexity API mock 서버")
+    parser.add_argument("--port", type=int, default=8099)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    server, base_url = start_mock_server(config_from_args(args), args.port)
+    print(f"mock Perplexity API: {base_url}/chat/completions (PERPLEXITY_API_BASE={base_url})")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,28 @@
+# gunicorn 설정 (Procfile: web: gunicorn app:app -c gunicorn.conf.py)
+# 기본은 gevent 워커: Perplexity API 호출, /logs SSE 스트림, 결과 다운로드가 모두 논블로킹 I/O로 처리되어
+# 프로세스 하나가 여러 검색 작업과 수백 개의 로그 구독 연결을 동시에 유지함
+# (sync 워커는 SSE 연결 하나가 워커 하나를 계속 점유함)
+#
+# 환경 변수
+#   GUNICORN_WORKER_CLASS        gevent(기본) | gthread | sync
+#   WEB_CONCURRENCY              워커 프로세스 수 (기본 1)
+#   GUNICORN_WORKER_CONNECTIONS  gevent 워커당 최대 동시 연결 수 (기본 1000)
+#   GUNICORN_THREADS             gthread 워커당 스레드 수 (기본 32)
+#   GUNICORN_TIMEOUT             워커 무응답 허용 시간(초, 기본 120)
+#   PORT                         바인딩 포트 (gunicorn 기본 동작)
+#
+# JOB_BACKEND=queue(Procfile 기본)이면 검색 작업은 worker.py 프로세스에서 실행되고 로그는 jobs.db를 거쳐 전달되므로
+# 웹 워커 수를 늘려도 됨. JOB_BACKEND=inline이면 작업과 로그 브로드캐스트가 요청을 받은 웹 워커 안에 있으므로
+# 한 작업의 /logs 구독과 일시정지/재개/취소 요청이 같은 워커에 닿도록 웹 워커는 1개로 두고 동시성은 gevent 연결 수로 확보
+import os
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+threads = int(os.environ.get("GUNICORN_THREADS", 32)) if worker_class == "gthread" else 1
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+
+# gevent는 워커 프로세스 시작 시 monkey patch 후 앱을 불러와야 하므로 preload 하지 않음
+preload_app = False
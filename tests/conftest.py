@@ -0,0 +1,36 @@
+# 테스트 공통 설정: app을 불러오기 전에 작업 DB/결과/체크포인트/업로드 경로를 임시 디렉터리로 돌림 (실제 ./data 를 건드리지 않음)
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+WORKDIR = tempfile.mkdtemp(prefix="pps-test-")
+os.environ.update(JOBS_DB_PATH=os.path.join(WORKDIR, "jobs.db"), RESULTS_DIR=os.path.join(WORKDIR, "results"),
+                  CHECKPOINT_DIR=os.path.join(WORKDIR, "checkpoints"), UPLOAD_DIR=os.path.join(WORKDIR, "uploads"),
+                  PRICE_CACHE_PATH=os.path.join(WORKDIR, "price_cache.db"), PRICE_CACHE_TTL="0")
+
+import app  # noqa: E402
+from bench_concurrency import setup_app  # noqa: E402
+from mock_perplexity import start_mock_server  # noqa: E402
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    # mock_api(MockConfig(...)) -> mock 서버를 띄우고 app을 연결 (테스트가 끝나면 서버 종료, app 전역 설정 복원)
+    servers = []
+    for name in ("API_BASE_URL", "price_cache", "api_keys", "circuit_breaker", "API_BACKOFF_BASE", "API_BACKOFF_MAX", "API_MAX_RETRIES"):
+        monkeypatch.setattr(app, name, getattr(app, name))
+
+    def start(config):
+        server, base_url = start_mock_server(config)
+        servers.append(server)
+        setup_app(base_url)
+        return config
+
+    yield start
+    for server in servers:
+        server.shutdown()
@@ -0,0 +1,35 @@
+# 동시 실행 수에 따른 처리 시간과 결과 행 순서 (mock Perplexity API 사용)
+import time
+
+from openpyxl import load_workbook
+
+import app
+from bench_concurrency import make_catalog
+from mock_perplexity import MockConfig
+
+ROWS = 40
+
+def run_job(concurrency):
+    job_id = app.job_store.create("test.xlsx")
+    started = time.perf_counter()
+    app.background_search(job_id, make_catalog(ROWS), "test.xlsx", app.get_default_system_prompt(), "sonar",
+                          concurrency=concurrency, rpm=0)
+    return app.job_store.get(job_id), time.perf_counter() - started
+
+def test_concurrency_speeds_up_job(mock_api):
+    mock_api(MockConfig(delay=0.05))
+    _, serial = run_job(1)
+    job, parallel = run_job(8)
+    assert job["status"] == "done"
+    assert parallel < serial / 3, f"concurrency=8 {parallel:.2f}s vs concurrency=1 {serial:.2f}s"
+
+def test_results_keep_input_order(mock_api):
+    mock_api(MockConfig(delay=0.01, jitter=0.05))  # 응답 순서가 뒤섞이도록 지연을 흩뜨림
+    job, _ = run_job(8)
+    assert job["status"] == "done"
+    wb = load_workbook(job["result_path"], read_only=True)
+    try:
+        names = [row[0] for row in wb.worksheets[0].iter_rows(min_row=2, max_col=1, values_only=True)]
+    finally:
+        wb.close()
+    assert names == [f"상품 {i}" for i in range(ROWS)]
@@ -0,0 +1,62 @@
+# 지연/오류/429/장애를 주입한 mock 서버에서 재시도, Retry-After, 서킷 브레이커 동작 확인
+import threading
+
+from openpyxl import load_workbook
+
+import app
+from bench_concurrency import make_catalog
+from mock_perplexity import MockConfig
+
+ROWS = 60
+
+def run_job(mock_api, config):
+    config.log = []
+    mock_api(config)
+    app.API_BACKOFF_BASE, app.API_BACKOFF_MAX = 0.05, 0.5  # 테스트 시간 단축
+    app.API_MAX_RETRIES = 10  # 오류 비율 30%에서 재시도 4회면 60행 중 한 행은 재시도를 소진할 확률이 높음
+    app.circuit_breaker = app.CircuitBreaker(failure_threshold=5, reset_seconds=0.5, max_pause=30)
+    job_id = app.job_store.create("test.xlsx")
+    app.background_search(job_id, make_catalog(ROWS), "test.xlsx", app.get_default_system_prompt(), "sonar",
+                          concurrency=8, rpm=0)
+    job = app.job_store.get(job_id)
+    assert job["status"] == "done", job["error"]
+    wb = load_workbook(job["result_path"], read_only=True)
+    try:
+        rows = list(wb.worksheets[0].iter_rows(min_row=2, max_col=9, values_only=True))
+    finally:
+        wb.close()
+    assert len(rows) == ROWS
+    assert sum(1 for row in rows if row[1] is None and row[5] is None) == 0  # 빈 결과 없음
+    return config.log
+
+def test_healthy(mock_api):
+    log = run_job(mock_api, MockConfig(delay=0.02))
+    assert len(log) == ROWS
+
+def test_retries_server_errors(mock_api):
+    log = run_job(mock_api, MockConfig(delay=0.02, error_rate=0.3))
+    assert any(status == 503 for _, status, _ in log)
+
+def test_rate_limit_respects_retry_after(mock_api):
+    retry_after = 0.3
+    log = run_job(mock_api, MockConfig(delay=0.02, rate_limit_rate=0.2, retry_after=retry_after))
+    rejected = [(received, message) for received, status, message in log if status == 429]
+    assert rejected
+    for received, message in rejected:
+        retry = min(t for t, _, m in log if m == message and t > received)
+        assert retry - received >= retry_after, f"{message}: {retry - received:.3f}s 후 재시도"
+
+def test_outage_pauses_then_resumes(mock_api):
+    outage = MockConfig(delay=0.02, error_rate=1.0)
+    timer = threading.Timer(1.5, lambda: setattr(outage, "error_rate", 0.0))
+    timer.start()
+    try:
+        log = run_job(mock_api, outage)
+    finally:
+        timer.cancel()
+    failed = [received for received, status, _ in log if status == 503]
+    assert failed
+    # 장애 중에는 서킷 브레이커가 호출을 멈춤: 재시도가 계속 쏟아지지 않고 reset_seconds 가까이 요청이 없는 구간이 있음
+    gaps = [b - a for a, b in zip(failed, failed[1:])]
+    assert max(gaps) >= 0.4
+    assert len(failed) < ROWS
@@ -0,0 +1,36 @@
+# 검색 작업 워커: 웹 프로세스(JOB_BACKEND=queue)가 jobs.db에 넣은 작업을 가져와 실행
+# 워커 프로세스 수만큼 작업이 여러 CPU 코어에서 동시에 실행되고, 웹 워커가 재시작되어도 작업은 계속됨
+# 사용법: python worker.py [--processes N]   (Procfile: worker: python worker.py)
+# 웹 프로세스와 같은 작업 디렉터리(jobs.db, 업로드/결과 파일)를 공유해야 함
+import argparse
+import multiprocessing
+import os
+import signal
+
+def run():
+    import app  # 프로세스마다 새로 불러와서 SQLite 연결/스레드 풀을 따로 생성
+    app.run_worker()
+
+def main():
+    parser = argparse.ArgumentParser(description="가격 검색 작업 워커")
+    parser.add_argument("--processes", type=int, default=int(os.environ.get("WORKER_PROCESSES", 1)),
+                        help="워커 프로세스 수 (기본: WORKER_PROCESSES 또는 1)")
+    args = parser.parse_args()
+    if args.processes <= 1:
+        run()
+        return
+
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run, name=f"worker-{i}") for i in range(args.processes)]
+    for process in processes: process.start()
+
+    def shutdown(signum, frame):
+        # 자식 프로세스가 실행 중인 작업을 대기 상태로 되돌린 뒤 종료하도록 전달
+        for process in processes:
+            if process.is_alive(): os.kill(process.pid, signal.SIGTERM)
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for process in processes: process.join()
+
+if __name__ == "__main__":
+    main()